@@ -0,0 +1,53 @@
+import json
+import os
+
+from .result_io import read_jsonl
+
+
+class CheckpointLog:
+    """
+    追加式断点日志：每完成一个公式向日志追加一行 {"key", "status", "value"}
+    --resume 时读取一次日志，状态属于 done_statuses 的 key 视为已完成，其余（出错、崩溃等）会被重新处理
+    """
+
+    def __init__(self, directory, name, done_statuses=('ok', 'timeout')):
+        self.log_path = os.path.join(directory, f'{name}.checkpoint.jsonl')
+        self.done_statuses = frozenset(done_statuses)
+        self.records = {}
+        self._log = None
+
+    def load_records(self):
+        """读取日志中的全部结果，返回 {key: (status, value)}；同一 key 以最后一条为准"""
+        records = {}
+        if os.path.exists(self.log_path):
+            for record in read_jsonl(self.log_path):
+                records[record['key']] = (record.get('status'), record.get('value'))
+        return records
+
+    def open(self, resume=False):
+        os.makedirs(os.path.dirname(self.log_path) or '.', exist_ok=True)
+        self.records = self.load_records() if resume else {}
+        self._log = open(self.log_path, 'a' if resume else 'w', encoding='utf-8')
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def is_done(self, key):
+        record = self.records.get(key)
+        return record is not None and record[0] in self.done_statuses
+
+    def append(self, key, status, value=None):
+        """只写入新完成的结果，不重写历史"""
+        self._log.write(json.dumps({"key": key, "status": status, "value": value}, ensure_ascii=False))
+        self._log.write('\n')
+        self._log.flush()
+        self.records[key] = (status, value)
+
+    def close(self):
+        if self._log is not None:
+            self._log.close()
+        self._log = None
@@ -0,0 +1,58 @@
+import logging
+import sys
+import time
+
+
+def setup_logging(level='WARNING'):
+    """配置根日志器；默认 WARNING，构造/融合过程中逐条公式的 debug/info 日志都不会输出"""
+    logging.basicConfig(
+        level=getattr(logging, str(level).upper(), logging.WARNING),
+        format='%(asctime)s - %(levelname)s - %(name)s - %(message)s',
+        stream=sys.stderr
+    )
+
+
+class ProgressReporter:
+    """
+    采样式进度报告：每处理 sample_every 个单元才检查一次时间，距上次输出超过 interval 秒时
+    输出已完成数量、速率（个/秒）与预计剩余时间；禁用时 update 只做一次整数加法
+    """
+
+    def __init__(self, total, label='formulas', enabled=False, interval=2.0, sample_every=8, stream=None):
+        self.total = total
+        self.label = label
+        self.enabled = enabled
+        self.interval = interval
+        self.sample_every = max(1, sample_every)
+        self.stream = stream if stream is not None else sys.stderr
+        self.count = 0
+        self._next_check = self.sample_every
+        self._start = time.monotonic()
+        self._last_report = self._start
+
+    def update(self, n=1):
+        self.count += n
+        if not self.enabled or self.count < self._next_check:
+            return
+        self._next_check = self.count + self.sample_every
+        now = time.monotonic()
+        if now - self._last_report >= self.interval:
+            self._last_report = now
+            self._report(now)
+
+    def close(self):
+        """输出最终进度"""
+        if self.enabled:
+            self._report(time.monotonic())
+
+    def _report(self, now):
+        elapsed = max(now - self._start, 1e-9)
+        rate = self.count / elapsed
+        if self.total and rate > 0:
+            remaining = max(self.total - self.count, 0) / rate
+            eta = f"ETA {remaining:.0f}s"
+        else:
+            eta = "ETA ?"
+        total = self.total if self.total else '?'
+        self.stream.write(f"[{self.label}] {self.count}/{total}  {rate:.1f}/s  {eta}\n")
+        self.stream.flush()
@@ -0,0 +1,101 @@
+import json
+import os
+
+
+class JsonlWriter:
+    """逐行写入 JSON 记录，每条记录写完立即刷新，中途崩溃不会丢失已写入的结果"""
+
+    def __init__(self, filepath, mode='w'):
+        self.filepath = filepath
+        self.mode = mode
+        self.count = 0
+        self._file = None
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.filepath) or '.', exist_ok=True)
+        self._file = open(self.filepath, self.mode, encoding='utf-8')
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def write(self, record):
+        self._file.write(json.dumps(record, ensure_ascii=False))
+        self._file.write('\n')
+        self._file.flush()
+        self.count += 1
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class ResultsObjectWriter:
+    """
+    以 {"results": {key: value, ...}} 的格式逐条写出结果
+    文件格式与整体 json.dump 相同，但无需在内存中持有全部结果
+    """
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.count = 0
+        self._file = None
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.filepath) or '.', exist_ok=True)
+        self._file = open(self.filepath, 'w', encoding='utf-8')
+        self._file.write('{"results": {')
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def write(self, key, value):
+        if self.count:
+            self._file.write(',')
+        self._file.write('\n    ')
+        self._file.write(json.dumps(key, ensure_ascii=False))
+        self._file.write(': ')
+        self._file.write(json.dumps(value, ensure_ascii=False))
+        self._file.flush()
+        self.count += 1
+
+    def close(self):
+        if self._file is not None:
+            self._file.write('\n}}\n')
+            self._file.close()
+            self._file = None
+
+
+def read_jsonl(filepath):
+    """逐行读取 JSONL 文件，跳过空行和崩溃时写了一半的末尾行"""
+    with open(filepath, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+
+def iter_construction_results(filepath):
+    """
+    按 (rule_name, result) 依次产出构造结果
+    同时支持流式 JSONL 与旧版整体 json.dump 的嵌套格式
+    """
+    if filepath.endswith('.jsonl'):
+        for record in read_jsonl(filepath):
+            for result in record.get('results', []):
+                yield record.get('rule_name'), result
+        return
+
+    with open(filepath, 'r', encoding='utf-8') as f:
+        construction_results = json.load(f)
+    for rule_name, rule_data in construction_results.items():
+        for formula_info in rule_data.get('formulas', []):
+            for execution in formula_info.get('executions', []):
+                for result in execution.get('results', []):
+                    yield rule_name, result
@@ -1,18 +1,51 @@
 import sympy as sp
-from sympy import expand, Eq
 import random
 import re
-from sympy import UnevaluatedExpr
+import logging
 from trick_rules.rule_module import FormulaManipulator
+from trick_rules.catalogue import TrickCatalogue
+from trick_rules.symbols import ordered_symbols
+from trick_rules.budget import ExprSize, LEAF, StructuralBudget, equation_sizes, expansion_bound
+from fusion.result_pool import ResultPool
+
+
+logger = logging.getLogger(__name__)
+
+
+def replace_first(expr, symbol, replacement):
+    """
+    把 expr 中先序遍历遇到的第一个 symbol 替换为 replacement，其余出现保持不变
+    只重建从根到该叶子的路径；expr 中没有 symbol 时原样返回
+    """
+    if expr == symbol:
+        return replacement
+    for idx, arg in enumerate(expr.args):
+        if arg.has(symbol):
+            args = list(expr.args)
+            args[idx] = replace_first(arg, symbol, replacement)
+            return expr.func(*args)
+    return expr
 
 
 
 class Operations():
     #import pdb;
-    def __init__(self):
+    def __init__(self, rng=None, budget=None):
+        # 与内部的 FormulaManipulator 共用同一个随机数生成器
+        self.rng = rng if rng is not None else random.Random()
+        # 结构预算：各变换在构造结果之前按操作数规模推算结果规模，超出预算的变换直接放弃
+        self.budget = budget if budget is not None else StructuralBudget()
+        # 最近一次被接受的变换结果的 (左侧规模, 右侧规模)
+        self.last_sizes = None
+        # 本次 execute_operations 中已产生的拼接结果，供后续拼接复用
+        self.result_pool = ResultPool(self.rng)
+        # 本次 execute_operations 中由变换直接构造出的结果树：结果字符串 -> sp.Eq，get_sp_expr 优先取用而不重新解析
+        self._trees = {}
         self.reset_counters()
         self.operations_list = [1,2,3,4,5,6]
-        self.formula_manipulator = FormulaManipulator()
+        self.formula_manipulator = FormulaManipulator(rng=self.rng)
+        # 融合阶段一开始就使用扩展符号表，解析结果不依赖之前处理过哪些公式（并行与串行一致）
+        self.formula_manipulator.extend_symbol_table()
         self.local_dict = self.formula_manipulator.local_dict
         self.variable_library = list('ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz') + \
                                [chr(i) for i in range(0x03B1, 0x03C9 + 1)]
@@ -46,7 +79,7 @@ class Operations():
         if isinstance(expr, sp.Eq):
             # 检查是否意外得到了布尔值结果
             if isinstance(expr.rhs, (sp.logic.boolalg.BooleanTrue, sp.logic.boolalg.BooleanFalse)):
-                print(f"警告：检测到布尔值结果 {expr.rhs}，这可能表示前面的操作有问题")
+                logger.warning("检测到布尔值结果 %s，这可能表示前面的操作有问题", expr.rhs)
                 # 返回原始等式而不是布尔值
                 return f"{str(expr.lhs)} = {str(expr.rhs)}"
             expr_str = f"{str(expr.lhs)} = {str(expr.rhs)}"
@@ -78,6 +111,9 @@ class Operations():
             expr_str = expr_str[0]
         if isinstance(expr_str, sp.Eq):
             return expr_str
+        tree = self._trees.get(expr_str)
+        if tree is not None:
+            return tree
         # 确保输入是字符串类型
         if not isinstance(expr_str, str):
             raise TypeError(f"输入类型必须为 str/list/tuple，实际类型: {type(expr_str)}")
@@ -86,12 +122,8 @@ class Operations():
         if '=' not in expr_str:
             raise ValueError(f"输入字符串必须包含等号: {expr_str}")
 
-        # 分割左右表达式
-        left_str, right_str = expr_str.split('=', 1) 
-        
-        lhs = sp.sympify(left_str.strip(), locals=self.local_dict)
-        rhs = sp.sympify(right_str.strip(), locals=self.local_dict)
-        return sp.Eq(lhs, rhs, evaluate=False)  # 添加 evaluate=False 防止自动求值
+        # 经共享缓存解析，结果已是 evaluate=False 的 sp.Eq，防止自动求值
+        return self.formula_manipulator.parse_cached(expr_str)[0]
         
 
 
@@ -115,7 +147,7 @@ class Operations():
             
             formula_str = self.get_str_expr(expr)
             if '=' in formula_str:
-                sp_expr = self.get_sp_expr(formula_str)
+                sp_expr = self.get_sp_expr(expr)
                 if sp_expr is None:
                     return formula_str
                 
@@ -123,41 +155,42 @@ class Operations():
                 orig_right_expr = sp_expr.rhs
                 
                 # 随机选择一个变量进行替换
-                variables = list(orig_right_expr.free_symbols)
+                variables = ordered_symbols(orig_right_expr.free_symbols)
                 if not variables:
                     return formula_str
                 
-                selected_var = random.choice(variables)
-                new_value = random.randint(1, 100)
+                selected_var = self.rng.choice(variables)
+                new_value = self.rng.randint(1, 100)
                 
                 new_right_expr = orig_right_expr.subs(selected_var, new_value)
                 new_formula = f"{sp.sstr(orig_left_expr)} = {sp.sstr(new_right_expr)}"
+                self._trees[new_formula] = sp.Eq(orig_left_expr, new_right_expr, evaluate=False)
                 
                 return new_formula
             
             return formula_str
         except Exception as e:
             # 如果解析失败，返回原始表达式
-            return str(expr)
+            return self.get_str_expr(expr)
 
 
     # 合并同类项
-    def combining_similar_terms(self, expr):
+    def combining_similar_terms(self, expr, sizes=None):
         try:
-            # 检查表达式是否过于复杂
-            expr_str = str(expr)
-            if len(expr_str) > 500:
-                return expr_str
+            # 检查表达式是否过于复杂（超出预算时原样返回，不做收集）
+            if sizes is not None and sum(size.nodes for size in sizes) > self.budget.max_collect_nodes:
+                return self.get_str_expr(expr)
             
+            # 变换已构造出的树（替换、代入的结果，幂塔逐层构造）直接取用，不重新解析
             expr_sp = self.get_sp_expr(expr)
             if expr_sp is None:
-                return str(expr)
-            
-            # 限制变量库的大小，避免复杂的收集操作
-            limited_vars = list(self.variable_library)[:10]  # 只使用前10个变量
+                return self.get_str_expr(expr)
             
             try:
-                combined = sp.collect(expr_sp.rhs, limited_vars)
+                combined = self.collect_terms(expr_sp.rhs)
+                # 合并结果超出结构预算时不采用
+                if not self.budget.allows(equation_sizes(expr_sp.lhs, combined)):
+                    return f"{str(expr_sp.lhs)} = {str(expr_sp.rhs)}"
                 # 确保返回标准等式格式
                 return f"{str(expr_sp.lhs)} = {str(combined)}"
             except Exception as e:
@@ -166,11 +199,50 @@ class Operations():
                 
         except Exception as e:
             # 如果解析失败，返回原始表达式
-            return str(expr)
+            return self.get_str_expr(expr)
+
+
+    def collect_terms(self, expr):
+        """
+        只对 expr 中实际出现的自由符号合并同类项
+        多项式项在稀疏多项式环中合并（会展开乘积与乘方），其余项连同合并结果再按这些符号 collect；
+        展开后的项数或次数预计超出预算的多项式项不进入环，多项式项无法放入环中时整体退回 sp.collect
+        """
+        symbols = ordered_symbols(expr.free_symbols)
+        if not symbols:
+            return expr
+        
+        poly_terms, other_terms = [], []
+        # 已放入环中的多项式项展开后的项数之和
+        expanded_terms = 0
+        for term in sp.Add.make_args(expr):
+            if term.is_polynomial(*symbols):
+                terms, degree = expansion_bound(term)
+                if (degree <= self.budget.max_collect_degree
+                        and expanded_terms + terms <= self.budget.max_collect_terms):
+                    poly_terms.append(term)
+                    expanded_terms += terms
+                    continue
+            other_terms.append(term)
+        if not poly_terms:
+            return sp.collect(expr, symbols)
+        
+        try:
+            _, poly = sp.sring(sp.Add(*poly_terms), *symbols)
+        except Exception:
+            return sp.collect(expr, symbols)
+        combined = poly.as_expr()
+        if not other_terms:
+            return combined
+        return sp.collect(sp.Add(combined, *other_terms), symbols)
 
 
     #拼接
-    def concatenate_formulas(self, formula, all_tricks, results=None):
+    def concatenate_formulas(self, formula, all_tricks, results=None, sizes=None):
+        """
+        results 为之前结果的 ResultPool（也兼容 results 字典）
+        sizes 为当前公式的 (左侧规模, 右侧规模)；给出时按规模推算结果，超出预算返回 None
+        """
         # 如果输入是列表或元组，获取第一个元素
         if isinstance(formula, list):
             formula = formula[0]
@@ -182,50 +254,58 @@ class Operations():
             orig_left = str(formula.lhs)
             orig_right = str(formula.rhs)
         else:
-            formula_str = str(formula)
+            formula_str = self.get_str_expr(formula)
             parts = formula_str.split('=', 1)
             if len(parts) < 2:
                 return formula_str
             orig_left = parts[0].strip()
             orig_right = parts[1].strip()
         
-        # 收集所有有效的等式
-        valid_tricks = []
-        
-        # 添加 all_tricks 中的等式
-        for trick in all_tricks.keys():
-            if '=' in trick:
-                valid_tricks.append(trick)
+        catalogue = TrickCatalogue.ensure(all_tricks, self.local_dict)
         
-        # 只在 results 存在时添加之前的结果
-        if results:
-            for result in results.values():
-                for operand in result.get('fusion_operands', []):
-                    if operand.get('operation') == 2:
-                        formula = operand.get('result', '')
-                        if '=' in formula:
-                            valid_tricks.append(formula)
+        # 目录中的等式已预先筛选，之前的结果由结果池增量维护
+        if isinstance(results, dict):
+            valid_tricks = ResultPool.from_results(results, self.rng)
+        else:
+            valid_tricks = results if results is not None else ()
         
-        if not valid_tricks:
+        total = len(catalogue) + len(valid_tricks)
+        if not total:
             return f"{orig_left} = {orig_right}"
         
         # 随机选择要添加的公式数量
-        max_additions = min(len(valid_tricks), 3)
-        num_additions = random.randint(1, max_additions)
+        max_additions = min(total, 3)
+        num_additions = self.rng.randint(1, max_additions)
         
         # 随机选择公式并分别处理左右两边
         new_left_parts = [orig_left]
         new_right_parts = [orig_right]
         
-        # 随机选择不重复的公式
-        selected_tricks = random.sample(valid_tricks, num_additions)
+        part_sizes = []
         
-        for trick in selected_tricks:
-            parts = trick.split('=', 1)
-            if len(parts) == 2:
-                trick_left, trick_right = parts
+        # 在 目录 + 之前结果 上按下标抽取不重复的公式，无需拼接列表
+        for idx in self.rng.sample(range(total), num_additions):
+            if idx < len(catalogue):
+                entry = catalogue[idx]
+                new_left_parts.append(entry.left)
+                new_right_parts.append(entry.right)
+                part_sizes.append(entry.sizes)
+            else:
+                previous, previous_sizes = valid_tricks[idx - len(catalogue)]
+                trick_left, trick_right = previous.split('=', 1)
                 new_left_parts.append(trick_left.strip())
                 new_right_parts.append(trick_right.strip())
+                part_sizes.append(previous_sizes)
+        
+        if sizes is not None:
+            # 在拼接字符串之前按规模检查预算
+            if any(part is None or None in part for part in part_sizes):
+                return None
+            new_sizes = (sizes[0].plus(*(part[0] for part in part_sizes)),
+                         sizes[1].plus(*(part[1] for part in part_sizes)))
+            if not self.budget.allows(new_sizes):
+                return None
+            self.last_sizes = new_sizes
         
         # 组合新的等式
         new_left = ' + '.join(new_left_parts)
@@ -242,7 +322,7 @@ class Operations():
         elif isinstance(formula, tuple):
             formula = formula[0]
  
-        formula_str = str(formula)
+        formula_str = self.get_str_expr(formula)
         
         if '==' in formula_str:
             left_side, right_side = formula_str.split('==', 1)
@@ -258,7 +338,7 @@ class Operations():
         # 生成新的左边表达式
         if len(left_factors) >= 2:
             # 随机打乱因子顺序
-            random.shuffle(left_factors)
+            self.rng.shuffle(left_factors)
             new_left = f"({')('.join(left_factors)})"
         else:
             new_left = left_side.strip()
@@ -268,114 +348,149 @@ class Operations():
         
         
 
-    def replace_with_formula(self, formula, all_tricks):
+    def replace_with_formula(self, formula, all_tricks, sizes=None):
         try:
+            # 检查右侧是否过于复杂，超出预算时在任何解析之前放弃替换
+            if sizes is not None and sizes[1].nodes > self.budget.max_replace_nodes:
+                return None
+            
             formula_str = self.get_str_expr(formula)
             if '=' not in formula_str:
                 return formula_str
-                
-            # 简化处理：直接进行字符串替换而不是sympy计算
-            left_part, right_part = formula_str.split('=', 1)
-            
-            # 检查右侧是否过于复杂
-            if len(right_part) > 200:  # 如果右侧太长，跳过替换
-                return formula_str
-            
-            valid_replacements = []
             
-            # 从all_tricks中选择简单的公式进行替换
-            simple_tricks = []
-            for trick_formula in all_tricks:
-                if '=' in trick_formula:
-                    _, trick_right = trick_formula.split('=', 1)
-                    # 只选择简单的右侧表达式
-                    if len(trick_right.strip()) < 50:
-                        simple_tricks.append(trick_formula)
+            equation = self.get_sp_expr(formula)
+            right_expr = equation.rhs
             
-            if not simple_tricks:
+            # 倒排索引：右侧自由符号 -> 右侧同样含有该符号的简单技巧（右侧长度 < 50）
+            index = TrickCatalogue.ensure(all_tricks, self.local_dict).by_symbol(50)
+            candidates = [symbol for symbol in ordered_symbols(right_expr.free_symbols) if symbol in index]
+            if not candidates:
                 return formula_str
             
-            # 随机选择1-2个简单公式进行替换
-            num_replacements = min(2, len(simple_tricks))
-            selected_tricks = random.sample(simple_tricks, num_replacements)
+            # 随机选择一个变量及一个技巧，只构造被选中的替换
+            symbol = self.rng.choice(candidates)
+            trick = self.rng.choice(index[symbol])
             
-            for trick_formula in selected_tricks:
-                try:
-                    _, trick_right = trick_formula.split('=', 1)
-                    trick_right = trick_right.strip()
-                    
-                    # 简单的字符串替换：将右侧的变量替换为新的表达式
-                    new_right = right_part
-                    # 替换常见的变量
-                    for var in ['a', 'b', 'α', 'β']:
-                        if var in new_right and var in trick_right:
-                            # 避免无限递归，只替换一次
-                            new_right = new_right.replace(var, f"({trick_right})", 1)
-                            break
-                    
-                    if new_right != right_part:
-                        new_formula = f"{left_part.strip()} = {new_right.strip()}"
-                        valid_replacements.append(new_formula)
-                        
-                except Exception as e:
-                    # 如果单个替换失败，继续下一个
-                    continue
+            if sizes is not None:
+                # 只有一处出现被替换为技巧右侧
+                new_sizes = (sizes[0], sizes[1].substituted(trick.sizes[1]))
+                if not self.budget.allows(new_sizes):
+                    return None
+                self.last_sizes = new_sizes
             
-            return random.choice(valid_replacements) if valid_replacements else formula_str
+            # 在表达式树上替换，不会误匹配 tan 中的 a 之类的标识符片段；
+            # 与原来的字符串替换一样只替换一处，右侧不会随变量的出现次数成倍增长
+            new_right = replace_first(right_expr, symbol, trick.rhs_expr)
+            new_formula = f"{sp.sstr(equation.lhs)} = {sp.sstr(new_right)}"
+            self._trees[new_formula] = sp.Eq(equation.lhs, new_right, evaluate=False)
+            return new_formula
             
         except Exception as e:
             # 如果解析失败，返回原始表达式
-            return str(formula)
+            return self.get_str_expr(formula)
             
 
-    def power_transform(self, formula, all_tricks):
+    def power_transform(self, formula, all_tricks, sizes=None):
         try:
             if isinstance(formula, (list, tuple)):
                 formula = formula[0]
             
-            # 获取输入等式的字符串表示
-            formula_str = self.get_str_expr(formula)
+            # 检查公式是否过于复杂，超出预算时在构造字符串之前放弃
+            if sizes is not None and sum(size.nodes for size in sizes) > self.budget.max_power_nodes:
+                return None
             
-            # 检查公式是否过于复杂
-            if len(formula_str) > 300:
+            formula_str = self.get_str_expr(formula)
+            if '=' not in formula_str:
                 return formula_str
+            left, right = (part.strip() for part in formula_str.split('=', 1))
             
             # 随机选择转换方式
-            transform_type = random.choice(['number', 'trick'])
+            transform_type = self.rng.choice(['number', 'trick'])
             
             if transform_type == 'number':
                 # 随机选择一个2到10之间的数字作为底数
-                base = random.randint(2, 10)
-                # 构造新的等式
-                new_formula = f"{base}^{formula_str}"
+                base = self.rng.randint(2, 10)
+                base_size = LEAF
+                base_expr = sp.Integer(base)
+                # 新的等式为 base^(左侧) = 右侧，底数作用于整个左侧
+                new_left = f"{base}^({left})"
             else:
-                # 从all_tricks中随机选择一个简单的等式
-                valid_tricks = []
-                for trick in all_tricks.keys():
-                    if '=' in trick:
-                        _, trick_right = trick.split('=', 1)
-                        # 只选择简单的右侧表达式
-                        if len(trick_right.strip()) < 30:
-                            valid_tricks.append(trick)
+                # 从目录中随机选择一个右侧简单（长度 < 30）的等式
+                valid_tricks = TrickCatalogue.ensure(all_tricks, self.local_dict).short_rhs(30)
                 
                 if not valid_tricks:
-                    return formula_str
+                    return self.get_str_expr(formula)
                 
-                selected_trick = random.choice(valid_tricks)
+                selected_trick = self.rng.choice(valid_tricks)
                 # 只使用等式的右侧作为底数
-                base = selected_trick.split('=', 1)[1].strip()
-                # 构造新的等式
-                new_formula = f"({base})^{formula_str}"
+                base = selected_trick.right
+                base_size = selected_trick.sizes[1]
+                base_expr = selected_trick.rhs_expr
+                # 新的等式为 (base)^(左侧) = 右侧
+                new_left = f"({base})^({left})"
             
+            if sizes is not None:
+                # 底数作用在左侧
+                if base_size is None:
+                    return None
+                new_sizes = (sizes[0].raised_by(base_size), sizes[1])
+                if not self.budget.allows(new_sizes):
+                    return None
+                self.last_sizes = new_sizes
+            
+            new_formula = f"{new_left} = {right}"
+            # 在当前公式的树（通常已在 _trees 或解析缓存中）左侧包一层 Pow 记下结果树，
+            # 之后的幂次变换与合并同类项不再解析越来越深的指数字符串
+            if base_expr is not None:
+                try:
+                    equation = self.get_sp_expr(formula)
+                    self._trees[new_formula] = sp.Eq(sp.Pow(base_expr, equation.lhs), equation.rhs,
+                                                     evaluate=False)
+                except Exception:
+                    pass
             return new_formula
             
         except Exception as e:
             # 如果处理失败，返回原始公式
-            return str(formula)
+            return self.get_str_expr(formula)
+
+    def formula_sizes(self, formula):
+        """解析结果的 (左侧规模, 右侧规模)；不是等式时右侧按叶子计"""
+        if isinstance(formula, (list, tuple)):
+            formula = formula[0]
+        if isinstance(formula, sp.Eq):
+            return equation_sizes(formula.lhs, formula.rhs)
+        return ExprSize.of(formula), LEAF
+
+    def measured_sizes(self, formula, sizes, estimate, limit):
+        """
+        按解析结果重新统计规模；拼接、替换推算的规模是上界（解析时嵌套的 Add 被展平、重复项被合并），
+        逐步累加会越来越偏大。解析与下一次替换共用解析缓存，解析失败时沿用推算的规模
+        推算值 estimate 超过下一阶段上限 limit 的 budget.estimate_slack 倍时实测也不会低于上限，不解析
+        """
+        if not isinstance(formula, str) or estimate > limit * self.budget.estimate_slack:
+            return sizes
+        try:
+            return self.formula_sizes(self.get_sp_expr(formula))
+        except Exception:
+            return sizes
+
+    def _run_budgeted(self, transform, *args):
+        """
+        调用带 sizes 参数的变换，返回 (结果, 本次调用推算出的规模)
+        本次调用没有经过预算检查（未改变公式、出错或被拒绝）时规模为 None，不会沿用之前调用留下的值
+        """
+        self.last_sizes = None
+        result = transform(*args)
+        return result, self.last_sizes
 
     def execute_operations(self, user_formula, all_tricks, complexity):
         results = {}
-        times = random.randint(1, 5)  # 减少操作次数，提高性能
+        self.result_pool.clear()
+        self._trees.clear()
+        # 调用方未传入目录时在这里构建一次，本次所有操作共用
+        all_tricks = TrickCatalogue.ensure(all_tricks, self.local_dict)
+        times = self.rng.randint(1, 5)  # 减少操作次数，提高性能
         
         operation_counters = {
             'find_right_operand': 0,
@@ -414,6 +529,14 @@ class Operations():
                 formula = self.formula_manipulator.parse_user_formula(user_formula)
                 if formula is None:
                     continue
+                # 当前公式的结构规模，每次接受变换后按变换推算的规模更新
+                sizes = self.formula_sizes(formula)
+                if not self.budget.allows(sizes):
+                    # 输入本身已超出结构预算时所有带预算的变换都会被拒绝，不再生成只有操作 1/3/5 的结果
+                    logger.debug("公式超出结构预算，跳过融合: %s", user_formula)
+                    return results
+                # 本结果中拼接结果的规模，结果加入 results 时一并放入结果池
+                concatenated_sizes = {}
                 
                 result['formula']['left'] = str(self.formula_manipulator.separate_left(user_formula))
                 result['formula']['right'] = str(self.formula_manipulator.separate_right(user_formula))
@@ -421,99 +544,103 @@ class Operations():
                 # 第一阶段：确保至少执行三次concatenate_formulas
                 for _ in range(3):
                     try:
-                        if not is_numeric(str(formula)):
-                            operand_result = self.concatenate_formulas(formula, all_tricks, results)
-                            if operand_result is not None and operand_result != str(formula):
-                                formatted_result = self.get_str_expr(operand_result)
-                                # 检查结果是否过于复杂
-                                if len(formatted_result) < 1000:  # 限制结果长度
-                                    result['fusion_operands'].append({
-                                        "operation": 2,  # concatenate_formulas
-                                        "result": formatted_result
-                                    })
-                                    operation_counters['concatenate_formulas'] += 1
-                                    formula = operand_result  # 更新当前公式
+                        if not is_numeric(self.get_str_expr(formula)):
+                            operand_result, new_sizes = self._run_budgeted(
+                                self.concatenate_formulas, formula, all_tricks, self.result_pool, sizes)
+                            # 超出结构预算时返回 None；只接受本次调用经过预算检查并且确实改变了公式的结果
+                            formatted_result = self.get_str_expr(operand_result) if operand_result is not None else None
+                            if new_sizes is not None and formatted_result != self.get_str_expr(formula):
+                                result['fusion_operands'].append({
+                                    "operation": 2,  # concatenate_formulas
+                                    "result": formatted_result
+                                })
+                                operation_counters['concatenate_formulas'] += 1
+                                formula = operand_result  # 更新当前公式
+                                sizes = new_sizes
+                                concatenated_sizes[formatted_result] = sizes
                     except Exception as e:
                         # 如果操作失败，继续下一个操作
                         continue
                 
+                sizes = self.measured_sizes(formula, sizes, sizes[1].nodes, self.budget.max_replace_nodes)
+                
                 # 第二阶段：确保至少执行三次replace_with_formula
                 for _ in range(3):
                     try:
-                        operand_result = self.replace_with_formula(formula, all_tricks)
-                        if operand_result is not None and operand_result != str(formula):
-                            formatted_result = self.get_str_expr(operand_result)
-                            # 检查结果是否过于复杂
-                            if len(formatted_result) < 1000:  # 限制结果长度
-                                result['fusion_operands'].append({
-                                    "operation": 4,  # replace_with_formula
-                                    "result": formatted_result
-                                })
-                                operation_counters['replace_formula'] += 1
-                                formula = operand_result  # 更新当前公式
+                        operand_result, new_sizes = self._run_budgeted(
+                            self.replace_with_formula, formula, all_tricks, sizes)
+                        formatted_result = self.get_str_expr(operand_result) if operand_result is not None else None
+                        if new_sizes is not None and formatted_result != self.get_str_expr(formula):
+                            result['fusion_operands'].append({
+                                "operation": 4,  # replace_with_formula
+                                "result": formatted_result
+                            })
+                            operation_counters['replace_formula'] += 1
+                            formula = operand_result  # 更新当前公式
+                            sizes = new_sizes
                     except Exception as e:
                         # 如果操作失败，继续下一个操作
                         continue
                 
+                sizes = self.measured_sizes(formula, sizes, sum(size.nodes for size in sizes),
+                                            self.budget.max_power_nodes)
+                
                 # 第三阶段：确保至少执行三次power_transform
                 for _ in range(3):
                     try:
-                        operand_result = self.power_transform(formula, all_tricks)
-                        if operand_result is not None and operand_result != str(formula):
-                            formatted_result = self.get_str_expr(operand_result)
-                            # 检查结果是否过于复杂
-                            if len(formatted_result) < 1000:  # 限制结果长度
-                                result['fusion_operands'].append({
-                                    "operation": 6,  # power_transform
-                                    "result": formatted_result
-                                })
-                                operation_counters['power_transform'] += 1
-                                formula = operand_result  # 更新当前公式
+                        operand_result, new_sizes = self._run_budgeted(
+                            self.power_transform, formula, all_tricks, sizes)
+                        formatted_result = self.get_str_expr(operand_result) if operand_result is not None else None
+                        if new_sizes is not None and formatted_result != self.get_str_expr(formula):
+                            result['fusion_operands'].append({
+                                "operation": 6,  # power_transform
+                                "result": formatted_result
+                            })
+                            operation_counters['power_transform'] += 1
+                            formula = operand_result  # 更新当前公式
+                            sizes = new_sizes
                     except Exception as e:
                         # 如果操作失败，继续下一个操作
                         continue
                 
                 # 第四阶段：随机执行其他操作（除了combining_similar_terms）
                 other_operations = [1, 3]  # find_right_operand, generate_formulas
-                for _ in range(random.randint(0, 1)):  # 进一步减少随机操作次数
+                for _ in range(self.rng.randint(0, 1)):  # 进一步减少随机操作次数
                     try:
-                        operation = random.choice(other_operations)
+                        operation = self.rng.choice(other_operations)
                         operand_result = None
                         
                         if operation == 1:  # find_right_operand
-                            if not is_numeric(str(formula)):
+                            if not is_numeric(self.get_str_expr(formula)):
                                 operand_result = self.find_right_operand(formula)
                                 operation_counters['find_right_operand'] += 1
                         elif operation == 3:  # generate_formulas
-                            if not is_numeric(str(formula)):
+                            if not is_numeric(self.get_str_expr(formula)):
                                 operand_result = self.generate_formulas(formula)
                                 operation_counters['generate_formulas'] += 1
                         
-                        if operand_result is not None and operand_result != str(formula):
-                            formatted_result = self.get_str_expr(operand_result)
-                            # 检查结果是否过于复杂
-                            if len(formatted_result) < 1000:  # 限制结果长度
-                                result['fusion_operands'].append({
-                                    "operation": operation,
-                                    "result": formatted_result
-                                })
-                                formula = operand_result  # 更新当前公式
+                        # 代入数值与交换因子不会增大规模，沿用当前规模
+                        formatted_result = self.get_str_expr(operand_result) if operand_result is not None else None
+                        if formatted_result is not None and formatted_result != self.get_str_expr(formula):
+                            result['fusion_operands'].append({
+                                "operation": operation,
+                                "result": formatted_result
+                            })
+                            formula = operand_result  # 更新当前公式
                     except Exception as e:
                         # 如果操作失败，继续下一个操作
                         continue
                 
                 # 最后一步：执行combining_similar_terms
                 try:
-                    operand_result = self.combining_similar_terms(formula)
+                    operand_result = self.combining_similar_terms(formula, sizes)
                     if operand_result is not None:
                         formatted_result = self.get_str_expr(operand_result)
-                        # 检查结果是否过于复杂
-                        if len(formatted_result) < 1000:  # 限制结果长度
-                            result['fusion_operands'].append({
-                                "operation": 5,  # combining_similar_terms
-                                "result": formatted_result
-                            })
-                            operation_counters['combining_similar_terms'] += 1
+                        result['fusion_operands'].append({
+                            "operation": 5,  # combining_similar_terms
+                            "result": formatted_result
+                        })
+                        operation_counters['combining_similar_terms'] += 1
                 except Exception as e:
                     # 如果操作失败，跳过这一步
                     pass
@@ -525,6 +652,7 @@ class Operations():
                 # 只有当有操作结果时才添加到results中
                 if result['fusion_operands']:
                     results[f"result_{i}"] = result
+                    self.result_pool.add_result(result, concatenated_sizes)
                     
             except Exception as e:
                 # 如果整个处理过程失败，继续下一个
@@ -546,11 +674,3 @@ class Operations():
     #         5: 'combining_similar_terms'
     #     }
     #     return operations.get(operation, 'unknown')
-
-
-manipulator = FormulaManipulator()
-
-
-
-
-
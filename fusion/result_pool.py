@@ -0,0 +1,50 @@
+class ResultPool:
+    """
+    融合过程中可供再次拼接的 concatenate_formulas（操作 2）结果
+    结果在加入 results 时增量追加，拼接时按下标 O(1) 取用，不再每次遍历整个 results
+    超过 capacity 后按蓄水池抽样（Algorithm R）替换，池中始终是所有候选的均匀样本
+    """
+
+    def __init__(self, rng, capacity=256):
+        self.rng = rng
+        self.capacity = capacity
+        # 已见过的候选总数（包括未被保留的）
+        self.seen = 0
+        self._items = []
+
+    @classmethod
+    def from_results(cls, results, rng, capacity=256):
+        """从已有的 results 字典构建（兼容直接传入 results 的调用方）"""
+        pool = cls(rng, capacity)
+        for result in results.values():
+            pool.add_result(result)
+        return pool
+
+    def add(self, formula, sizes=None):
+        """追加一个候选公式及其 (左侧规模, 右侧规模)，不含等号的结果被忽略"""
+        if '=' not in formula:
+            return
+        self.seen += 1
+        if len(self._items) < self.capacity:
+            self._items.append((formula, sizes))
+            return
+        idx = self.rng.randrange(self.seen)
+        if idx < self.capacity:
+            self._items[idx] = (formula, sizes)
+
+    def add_result(self, result, sizes=None):
+        """追加一个融合结果中的全部操作 2 结果；sizes 为 结果字符串 -> 规模 的映射"""
+        for operand in result.get('fusion_operands', []):
+            if operand.get('operation') == 2:
+                formula = operand.get('result', '')
+                self.add(formula, sizes.get(formula) if sizes else None)
+
+    def clear(self):
+        self.seen = 0
+        self._items = []
+
+    def __len__(self):
+        return len(self._items)
+
+    def __getitem__(self, idx):
+        return self._items[idx]
@@ -0,0 +1,153 @@
+import multiprocessing
+import time
+from multiprocessing.connection import wait
+
+try:
+    import resource
+except ImportError:  # 非 POSIX 平台无法限制内存
+    resource = None
+
+
+STATUS_OK = 'ok'
+STATUS_ERROR = 'error'
+STATUS_TIMEOUT = 'timeout'
+STATUS_MEMORY = 'memory'
+STATUS_CRASHED = 'crashed'
+
+
+def _worker_loop(conn, init_fn, initargs, task_fn, memory_limit_mb):
+    # 地址空间上限：超出预算的分配在工作进程内抛出 MemoryError，不会拖垮主进程
+    if memory_limit_mb and resource is not None:
+        limit = memory_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    state = init_fn(*initargs) if init_fn is not None else None
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            break
+        if task is None:
+            break
+        try:
+            conn.send((STATUS_OK, task_fn(state, task)))
+        except MemoryError:
+            conn.send((STATUS_MEMORY, None))
+        except Exception as e:
+            conn.send((STATUS_ERROR, repr(e)))
+
+
+class _Worker:
+    def __init__(self, ctx, init_fn, initargs, task_fn, memory_limit_mb):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(
+            target=_worker_loop,
+            args=(child_conn, init_fn, initargs, task_fn, memory_limit_mb),
+            daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        self.tasks_done = 0
+        self.index = None
+        self.deadline = None
+
+    def submit(self, index, task, timeout):
+        self.index = index
+        self.deadline = time.monotonic() + timeout if timeout else None
+        self.conn.send(task)
+
+    def kill(self):
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(timeout=1)
+        self.kill()
+
+
+class WorkerSupervisor:
+    """
+    在独立工作进程中逐个执行任务，每个任务都有墙钟时间和内存预算
+    超时或崩溃的工作进程会被杀掉并替换，任务记录为 timeout/crashed，不会阻塞整批任务
+    与 signal.alarm 不同，可以中断卡在 C 层递归中的 SymPy 调用，也不限于主线程
+    """
+
+    def __init__(self, task_fn, init_fn=None, initargs=(), workers=1, timeout=60,
+                 memory_limit_mb=None, max_tasks_per_worker=None):
+        # task_fn(state, task) 与 init_fn(*initargs) 须为模块级函数
+        self.task_fn = task_fn
+        self.init_fn = init_fn
+        self.initargs = initargs
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self.memory_limit_mb = memory_limit_mb
+        self.max_tasks_per_worker = max_tasks_per_worker
+        # 因超时、崩溃或超出内存被杀掉替换的次数，与按 max_tasks_per_worker 计划回收的次数分开统计
+        self.restarts = 0
+        self.recycles = 0
+        self._ctx = multiprocessing.get_context()
+
+    def _spawn(self):
+        return _Worker(self._ctx, self.init_fn, self.initargs, self.task_fn, self.memory_limit_mb)
+
+    def _replace(self, pool, worker):
+        worker.kill()
+        pool[pool.index(worker)] = self._spawn()
+
+    def map(self, tasks):
+        """按提交顺序产出 (task, status, result)"""
+        tasks = list(tasks)
+        pool = [self._spawn() for _ in range(min(self.workers, len(tasks)) or 1)]
+        finished = {}
+        next_task = 0
+        next_yield = 0
+        try:
+            while next_yield < len(tasks):
+                # 给空闲的工作进程分配任务
+                for worker in pool:
+                    if worker.index is None and next_task < len(tasks):
+                        worker.submit(next_task, tasks[next_task], self.timeout)
+                        next_task += 1
+
+                busy = [worker for worker in pool if worker.index is not None]
+                deadlines = [worker.deadline for worker in busy if worker.deadline is not None]
+                wait_for = max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+                ready = wait([worker.conn for worker in busy], timeout=wait_for)
+
+                for worker in busy:
+                    index = worker.index
+                    if worker.conn in ready:
+                        try:
+                            status, result = worker.conn.recv()
+                        except (EOFError, OSError):
+                            # 进程被系统杀掉（如 OOM）或异常退出
+                            status, result = STATUS_CRASHED, None
+                    elif worker.deadline is not None and time.monotonic() >= worker.deadline:
+                        status, result = STATUS_TIMEOUT, None
+                    else:
+                        continue
+
+                    finished[index] = (status, result)
+                    worker.index = None
+                    worker.tasks_done += 1
+                    recycle = (self.max_tasks_per_worker
+                               and worker.tasks_done >= self.max_tasks_per_worker)
+                    if status in (STATUS_TIMEOUT, STATUS_CRASHED, STATUS_MEMORY):
+                        self._replace(pool, worker)
+                        self.restarts += 1
+                    elif recycle:
+                        self._replace(pool, worker)
+                        self.recycles += 1
+
+                while next_yield in finished:
+                    status, result = finished.pop(next_yield)
+                    yield tasks[next_yield], status, result
+                    next_yield += 1
+        finally:
+            for worker in pool:
+                worker.stop()
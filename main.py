@@ -1,25 +1,133 @@
-from trick_rules.rule_module import FormulaManipulator
-from config import all_tricks 
 import argparse
 import json
-import sympy
 import random
 import os
+import multiprocessing
+import logging
 
-from trick_rules import *
-from fusion.operations import Operations
+from data.result_io import JsonlWriter, ResultsObjectWriter, iter_construction_results
+from data.progress import ProgressReporter, setup_logging
 
-alpha, beta = sympy.symbols('α β')
-a, b, n, pi, k = sympy.symbols('a b n pi k')
-q, d = sympy.symbols('q d')
+# sympy、config、trick_rules 与 fusion 在用到它们的函数内才导入，
+# 使 --function 0 等简单调用和 spawn 方式重新导入本模块的工作进程不必加载 sympy
 
-def tricks_construction():
-    print("开始执行 tricks_fusion...")
+logger = logging.getLogger(__name__)
+
+CONSTRUCTION_FILE = 'data/composition/construct_result_all.jsonl'
+LEGACY_CONSTRUCTION_FILE = 'data/composition/construct_result_all.json'
+FUSION_FILE = 'data/tricks/fusion_results_all.json'
+VERIFICATION_FILE = 'data/verification/verification_report.jsonl'
+
+# 并行构造时每个工作进程持有自己的 FormulaManipulator
+_worker_manipulator = None
+
+
+def construction_seed(seed, rule_name, formula_index, transformation_round):
+    """构造阶段每个 (规则, 公式, 轮次) 的种子，只由这四项决定，与执行顺序及进程划分无关"""
+    return f"{seed}:{rule_name}:{formula_index}:{transformation_round}"
+
+
+def fusion_seed(seed, formula):
+    """融合阶段每个公式的种子，按公式本身派生，按规则过滤后同一公式的结果不变"""
+    return f"{seed}:{formula}"
+
+
+def _init_construction_worker():
+    global _worker_manipulator
+    from trick_rules.rule_module import FormulaManipulator
+    _worker_manipulator = FormulaManipulator()
+
+
+def _construct_jobs(manipulator, jobs):
+    """
+    批量执行 (公式, 各轮种子) 工作单元，每个公式只解析一次，多轮变换共享原始结构
+    逐轮产出 (rule_name, formula_index, trick_expr, round, num_operations, results)
+    """
+    def seed_round(position, transformation_round):
+        # 每轮开始前按该轮的种子重置生成器，保证结果与并行切分方式无关
+        manipulator.rng.seed(jobs[position][3][transformation_round])
+        return manipulator.rng.randint(1, 10)
+
+    batch = manipulator.execute_functions_batch(
+        ((trick_expr, len(round_seeds)) for _, _, trick_expr, round_seeds in jobs),
+        before_round=seed_round
+    )
+    for position, transformation_round, num_operations, results in batch:
+        rule_name, formula_index, trick_expr, _ = jobs[position]
+        yield rule_name, formula_index, trick_expr, transformation_round, num_operations, results
+
+
+def _construct_job(job):
+    """在工作进程中执行一个公式的全部轮次"""
+    if _worker_manipulator is None:
+        _init_construction_worker()
+    return list(_construct_jobs(_worker_manipulator, [job]))
+
+
+def regenerate_construction_sample(trick_expr, rule_name, formula_index, transformation_round, seed):
+    """
+    不重跑整个流程，单独重新生成构造结果中的一条记录
+    参数取自 jsonl 记录（original_expression、rule_name、formula_index，transformation_round 从 0 计），返回 (num_operations, results)
+    """
+    from trick_rules.rule_module import FormulaManipulator
+    round_seed = construction_seed(seed, rule_name, formula_index, transformation_round)
+    job = (rule_name, formula_index, trick_expr, [round_seed])
+    _, _, _, _, num_operations, results = next(_construct_jobs(FormulaManipulator(), [job]))
+    return num_operations, results
+
+
+# 并行融合时每个工作进程持有自己的 Operations 与只读技巧目录
+_fusion_ops = None
+_fusion_catalogue = None
+
+
+def _init_fusion_worker(catalogue, ops=None):
+    global _fusion_ops, _fusion_catalogue
+    if ops is None:
+        from fusion.operations import Operations
+        ops = Operations()
+    _fusion_ops = ops
+    _fusion_catalogue = catalogue
+
+
+def _fuse_chunk(chunk):
+    """对一批公式执行融合操作，返回 [(formula, rule, operation_results), ...]"""
+    chunk_results = []
+    for formula, rule, complexity, formula_seed in chunk:
+        _fusion_ops.rng.seed(formula_seed)
+        operation_results = _fusion_ops.execute_operations(
+            user_formula=formula,
+            all_tricks=_fusion_catalogue,
+            complexity=complexity
+        )
+        chunk_results.append((formula, rule, operation_results))
+    return chunk_results
+
+
+def _write_fusion_results(writer, chunk_results, reporter):
+    for formula, rule, operation_results in chunk_results:
+        writer.write(formula, {
+            "rule": rule,
+            "operations": operation_results
+        })
+        reporter.update()
+
+
+def tricks_construction(workers=1, seed=None, rounds=10, progress=False):
+    logger.info("开始执行 tricks_construction...")
+    from config import all_tricks
+    from trick_rules.rule_module import FormulaManipulator
+    from trick_rules.fingerprint import FormulaDeduplicator
+    from trick_rules.parse_cache import formula_cache
     formula_manipulator = FormulaManipulator()
-    all_rules_results = {}
     
     total_tricks = len(all_tricks)
     current_trick = 0
+
+    # 未指定种子时随机生成一个，保证各工作单元的种子互不相同
+    if seed is None:
+        seed = random.randrange(2 ** 32)
+    logger.info("随机种子: %s", seed)
     
     # 按规则类型分组处理公式
     grouped_tricks = {}
@@ -28,127 +136,164 @@ def tricks_construction():
             grouped_tricks[rule_name] = []
         grouped_tricks[rule_name].append(trick_expr)
     
-    # 处理每个规则类型下的所有公式
+    # 仅项顺序或空白不同的公式只构造一次
+    deduplicator = FormulaDeduplicator(formula_manipulator.local_dict)
+    
+    # 每个公式对应一个工作单元，附带各轮的种子
+    jobs = []
     for rule_name, formulas in grouped_tricks.items():
-        all_results = []
+        formula_index = 0
         
         for trick_expr in formulas:
             current_trick += 1
-            print(f"\n处理规则: {rule_name} ({current_trick}/{total_tricks})")
-            print(f"原始公式: {trick_expr}")
+            logger.debug("处理规则: %s (%d/%d)", rule_name, current_trick, total_tricks)
+            logger.debug("原始公式: %s", trick_expr)
             
             # 检查表达式是否为空
             if not trick_expr or not isinstance(trick_expr, str):
-                print(f"跳过无效公式: {trick_expr}")
+                logger.warning("跳过无效公式: %s", trick_expr)
                 continue
 
             expr, variables = formula_manipulator.parse_user_formula(trick_expr)
             if expr is None:
-                print(f"无法解析公式: {trick_expr}")
+                logger.warning("无法解析公式: %s", trick_expr)
                 continue
                 
-            print(f"解析结果: expr={expr}, variables={variables}")
+            logger.debug("解析结果: expr=%s, variables=%s", expr, variables)
             
-            formula_results = []
-            for transformation_round in range(10):
-                print(f"执行第 {transformation_round + 1}/10 轮变换...")
-                
-                num_operations = random.randint(1, 10)
-                print(f"本轮将执行 {num_operations} 次操作...")
-                
-                results = formula_manipulator.execute_functions(trick_expr, times=num_operations)
-                
-                if results:
-                    formula_results.append({
-                        "transformation_round": transformation_round + 1,
-                        "num_operations": num_operations,
-                        "results": results
-                    })
+            if not deduplicator.add(trick_expr):
+                logger.debug("跳过重复公式: %s", trick_expr)
+                continue
             
-            all_results.append({
+            round_seeds = [construction_seed(seed, rule_name, formula_index, transformation_round)
+                           for transformation_round in range(rounds)]
+            jobs.append((rule_name, formula_index, trick_expr, round_seeds))
+            formula_index += 1
+
+    logger.info("结构去重: 丢弃 %d 个重复公式", deduplicator.dropped)
+    
+    # 每个工作单元完成后立即追加一行 JSON，内存占用不随规则集增长
+    filepath = os.path.join(os.path.dirname(__file__), CONSTRUCTION_FILE)
+    reporter = ProgressReporter(len(jobs) * rounds, label='construction', enabled=progress)
+    with JsonlWriter(filepath) as writer:
+        if workers > 1:
+            logger.info("使用 %d 个进程并行执行 %d 个公式的 %d 轮变换...", workers, len(jobs), len(jobs) * rounds)
+            with multiprocessing.Pool(workers, initializer=_init_construction_worker) as pool:
+                job_results = pool.imap(_construct_job, jobs, chunksize=max(1, len(jobs) // (workers * 4)))
+                unit_results = (unit for units in job_results for unit in units)
+                _write_construction_results(writer, unit_results, rounds, reporter)
+        else:
+            # 串行时整批交给 execute_functions_batch，解析与原始结构只计算一次
+            _write_construction_results(writer, _construct_jobs(formula_manipulator, jobs), rounds, reporter)
+    reporter.close()
+    logger.info("All constructed results saved in %s (%d records)", filepath, writer.count)
+    logger.info("解析缓存统计: %s", formula_cache.stats())
+
+
+def _write_construction_results(writer, unit_results, rounds, reporter):
+    # imap/map 均按提交顺序返回，写出顺序与串行执行顺序一致
+    for rule_name, formula_index, trick_expr, transformation_round, num_operations, results in unit_results:
+        logger.debug("%s: 完成第 %d/%d 轮变换 (%d 次操作)", rule_name, transformation_round + 1, rounds, num_operations)
+        reporter.update()
+        if results:
+            writer.write({
+                "rule_name": rule_name,
+                "formula_index": formula_index,
                 "original_expression": trick_expr,
-                "executions": formula_results
+                "transformation_round": transformation_round + 1,
+                "num_operations": num_operations,
+                "results": results
             })
-                
-        
-        all_rules_results[rule_name] = {
-            "rule_name": rule_name,
-            "formulas": all_results
-        }
-        
-        print(f"Finish all construct of {rule_name}")
-    
-    filepath = os.path.join(os.path.dirname(__file__), 'data/composition/construct_result_all.json')
-    with open(filepath, 'w', encoding='utf-8') as f:
-        json.dump(all_rules_results, f, ensure_ascii=False, indent=4)
-    print(f"All constructed results saved in  {filepath}")
 
 
-def tricks_fusion(trick_name=None):
-    ops = Operations()
-    construction_file = os.path.join(os.path.dirname(__file__), 'data/composition/construct_result_all.json')
-    
-    # 读取构造结果文件
-    with open(construction_file, 'r', encoding='utf-8') as f:
-        construction_results = json.load(f)
+def collect_fusion_formulas(construction_file, trick_name=None, local_dict=None):
+    """
+    收集待融合的公式：构造结果中的 formula_after 加上 all_tricks，按结构指纹去重
+    返回 (公式 -> 规则名, formula_after -> 复杂度, 丢弃的重复公式数量)
+    """
+    from config import all_tricks
+    from trick_rules.fingerprint import FormulaDeduplicator
+    from trick_rules.symbols import EXTENDED_NAMESPACE
     
     all_formulas = {}
-    formula_complexity_pairs = []  # 存储 (formula_after, complexity) 元组
+    # formula_after -> complexity 索引
+    # 同一公式可能在多轮构造中重复出现，按首次出现为准（first-wins），与原线性查找的结果一致
+    formula_complexity = {}
     
-    # 第一步：从 construct_result_all.json 提取公式和复杂度
-    for rule_name, rule_data in construction_results.items():
+    # 第一步：从构造结果中流式提取公式和复杂度
+    for rule_name, result in iter_construction_results(construction_file):
         if trick_name and rule_name != trick_name:
             continue  # 过滤指定规则
         
-        # 遍历嵌套结构
-        for formula_info in rule_data.get('formulas', []):
-            for execution in formula_info.get('executions', []):
-                for result in execution.get('results', []):
-                    complexity = result.get('complexity')
-                    if complexity is None:
-                        continue  # 跳过无复杂度记录
-                        
-                    # 提取所有 tricks 中的 formula_after
-                    for trick in result.get('tricks', []):
-                        formula_after = trick.get('formula_after')
-                        if formula_after:
-                            formula_complexity_pairs.append((formula_after, complexity))
-                            all_formulas[formula_after] = rule_name 
+        complexity = result.get('complexity')
+        if complexity is None:
+            continue  # 跳过无复杂度记录
+            
+        # 提取所有 tricks 中的 formula_after
+        for trick in result.get('tricks', []):
+            formula_after = trick.get('formula_after')
+            if formula_after:
+                formula_complexity.setdefault(formula_after, complexity)
+                all_formulas[formula_after] = rule_name 
     
     # 第二步：合并 all_tricks 的公式
     for formula, rule in all_tricks.items():
         all_formulas[formula] = rule
     
+    # 按结构指纹去重，仅项顺序或空白不同的公式只融合一次（保留先出现的写法）
+    deduplicator = FormulaDeduplicator(local_dict if local_dict is not None else EXTENDED_NAMESPACE)
+    all_formulas = {formula: rule for formula, rule in all_formulas.items() if deduplicator.add(formula)}
+    return all_formulas, formula_complexity, deduplicator.dropped
+
+
+def tricks_fusion(trick_name=None, workers=1, seed=None, chunk_size=16, progress=False):
+    from fusion.operations import Operations
+    from trick_rules.catalogue import TrickCatalogue
+    from trick_rules.parse_cache import formula_cache
+    ops = Operations()
+    construction_file = os.path.join(os.path.dirname(__file__), CONSTRUCTION_FILE)
+    # 兼容旧版整体写出的 construct_result_all.json
+    if not os.path.exists(construction_file):
+        construction_file = os.path.join(os.path.dirname(__file__), LEGACY_CONSTRUCTION_FILE)
+    
+    all_formulas, formula_complexity, dropped = collect_fusion_formulas(
+        construction_file, trick_name, ops.local_dict)
+    # 默认日志级别为 WARNING，去重结果与其他阶段的统计一样总是可见
+    logger.warning("结构去重: 丢弃 %d 个重复公式，剩余 %d 个", dropped, len(all_formulas))
+    
+    # 技巧目录每轮只构建一次，所有融合操作共用
+    catalogue = TrickCatalogue(all_formulas, ops.local_dict)
+    
     # 第三步：执行操作并传递复杂度
-    results = {}
-    for formula, rule in all_formulas.items():
-        # 查找对应的复杂度（优先使用 construct 结果中的值）
-        complexity = next(
-            (c for f, c in formula_complexity_pairs if f == formula),
-            None  # all_tricks 公式默认无复杂度
-        )
-        # user_formula, all_tricks, complexity
-        # 调用执行函数并传入三元组
-        operation_results = ops.execute_operations(
-            user_formula=formula,
-            all_tricks=all_formulas,
-            complexity=complexity
-        )
-        
-        results[formula] = {
-            "rule": rule,
-            "operations": operation_results
-        }
+    if seed is None:
+        seed = random.randrange(2 ** 32)
+    logger.info("随机种子: %s", seed)
+    tasks = [
+        # 查找对应的复杂度（优先使用 construct 结果中的值），all_tricks 公式默认无复杂度
+        (formula, rule, formula_complexity.get(formula), fusion_seed(seed, formula))
+        for formula, rule in all_formulas.items()
+    ]
+    chunks = [tasks[i:i + chunk_size] for i in range(0, len(tasks), chunk_size)]
     
-    # 保存结果文件
-    file_dir = os.path.join(os.path.dirname(__file__), 'data/tricks')
-    filename = 'fusion_results_all.json' 
-    filepath = os.path.join(file_dir, filename)
+    # 结果按公式顺序逐条写入文件
+    filepath = os.path.join(os.path.dirname(__file__), FUSION_FILE)
 
-    with open(filepath, 'w', encoding='utf-8') as f:
-        json.dump({"results": results}, f, ensure_ascii=False, indent=4)
+    reporter = ProgressReporter(len(tasks), label='fusion', enabled=progress)
+    with ResultsObjectWriter(filepath) as writer:
+        if workers > 1:
+            logger.info("使用 %d 个进程并行融合 %d 个公式...", workers, len(tasks))
+            # 只读的技巧目录在进程初始化时传给每个工作进程一次，而不是随每个任务传递
+            with multiprocessing.Pool(workers, initializer=_init_fusion_worker, initargs=(catalogue,)) as pool:
+                for chunk_results in pool.imap(_fuse_chunk, chunks):
+                    _write_fusion_results(writer, chunk_results, reporter)
+        else:
+            _init_fusion_worker(catalogue, ops)
+            for chunk_results in map(_fuse_chunk, chunks):
+                _write_fusion_results(writer, chunk_results, reporter)
     
-    print(f"Fusion results saved in {filepath}")
+    reporter.close()
+    logger.info("Fusion results saved in %s", filepath)
+    logger.info("解析缓存统计: %s", formula_cache.stats())
     
 # def tricks_fusion(trick_name=None):
 #     ops = Operations()
@@ -194,18 +339,98 @@ def tricks_fusion(trick_name=None):
 #     print(f"Fusion results saved in {filepath}")
 
 
-parser = argparse.ArgumentParser(description='Template scripts. function 1: Hello World')
-parser.add_argument('--function', type=str, default=0, help='use this to specify function!')
-parser.add_argument('--v1', type=int, default=0, help='int value')
-parser.add_argument('--s1', type=str, default='none', help='string 1')
+def _iter_generated_formulas(construction_file, fusion_file):
+    """
+    产出待验证的 (stage, rule_name, original, steps)
+    steps 为 [(operation, formula), ...]；构造结果只验证 formula_after，融合结果验证每一步，以定位破坏等式的操作
+    """
+    if os.path.exists(construction_file):
+        for rule_name, result in iter_construction_results(construction_file):
+            original = result.get('formula', {})
+            original = f"{original.get('left')} = {original.get('right')}"
+            for trick in result.get('tricks', []):
+                if trick.get('formula_after'):
+                    yield 'construction', rule_name, original, [(None, trick['formula_after'])]
+    if os.path.exists(fusion_file):
+        with open(fusion_file, 'r', encoding='utf-8') as f:
+            fusion_results = json.load(f).get('results', {})
+        for original, entry in fusion_results.items():
+            for operation in entry.get('operations', {}).values():
+                steps = [(operand.get('operation'), operand.get('result'))
+                         for operand in operation.get('fusion_operands', []) if operand.get('result')]
+                if steps:
+                    yield 'fusion', entry.get('rule'), original, steps
+
+
+def verify_results(rtol=1e-6, complex_values=False, progress=False):
+    """
+    数值验证构造与融合结果是否仍为恒等式，只把不成立（或无法求值）的公式写入报告
+    返回 {stage: {status: count}}
+    """
+    from trick_rules.verifier import IdentityVerifier, NOT_IDENTITY, ERROR
+    verifier = IdentityVerifier(rtol=rtol, complex_values=complex_values)
+    base_dir = os.path.dirname(__file__)
+    construction_file = os.path.join(base_dir, CONSTRUCTION_FILE)
+    if not os.path.exists(construction_file):
+        construction_file = os.path.join(base_dir, LEGACY_CONSTRUCTION_FILE)
+    fusion_file = os.path.join(base_dir, FUSION_FILE)
+
+    counts = {}
+    reporter = ProgressReporter(None, label='verification', enabled=progress)
+    filepath = os.path.join(base_dir, VERIFICATION_FILE)
+    with JsonlWriter(filepath) as writer:
+        for stage, rule_name, original, steps in _iter_generated_formulas(construction_file, fusion_file):
+            # 最终结果的状态计入统计；第一个不成立或出错的步骤即为破坏等式的操作，无法判断（undetermined）的步骤不计
+            final = verifier.verify(steps[-1][1])
+            stage_counts = counts.setdefault(stage, {})
+            stage_counts[final.status] = stage_counts.get(final.status, 0) + 1
+            reporter.update()
+            if final.status not in (NOT_IDENTITY, ERROR):
+                continue
+            broken_by = None
+            for operation, formula in steps:
+                if verifier.verify(formula).status in (NOT_IDENTITY, ERROR):
+                    broken_by = operation
+                    break
+            writer.write({
+                "stage": stage,
+                "rule_name": rule_name,
+                "original": original,
+                "formula": steps[-1][1],
+                "broken_by_operation": broken_by,
+                **final.to_dict()
+            })
+    reporter.close()
+    logger.info("验证结果: %s", counts)
+    logger.info("Verification report saved in %s (%d records)", filepath, writer.count)
+    return counts
 
-args = parser.parse_args()
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Template scripts. function 1: Hello World')
+    parser.add_argument('--function', type=str, default=0, help='use this to specify function!')
+    parser.add_argument('--v1', type=int, default=0, help='int value')
+    parser.add_argument('--s1', type=str, default='none', help='string 1')
+    parser.add_argument('--workers', type=int, default=1, help='number of worker processes')
+    parser.add_argument('--seed', type=int, default=None, help='base random seed')
+    parser.add_argument('--parse-cache-size', type=int, default=4096, help='max entries of the formula parse cache')
+    parser.add_argument('--log-level', type=str, default='WARNING', help='logging level (DEBUG/INFO/WARNING/ERROR)')
+    parser.add_argument('--progress', action='store_true', help='report formulas/s and ETA on stderr')
+    parser.add_argument('--rtol', type=float, default=1e-6, help='relative tolerance of the identity verifier')
+    parser.add_argument('--complex-values', action='store_true', help='verify on principal complex values instead of discarding non-real points')
+
+    args = parser.parse_args()
+
+    setup_logging(args.log_level)
+    if args.function in ('1', '2', '3'):
+        from trick_rules.parse_cache import set_cache_size
+        set_cache_size(args.parse_cache_size)
     if args.function == '0':
         print("no function indicate")
     elif args.function == '1':
-        tricks_construction()
+        tricks_construction(workers=args.workers, seed=args.seed, progress=args.progress)
     elif args.function == '2':
         rule_name = args.s1 if args.s1 != 'none' else None
-        tricks_fusion(rule_name)
\ No newline at end of file
+        tricks_fusion(rule_name, workers=args.workers, seed=args.seed, progress=args.progress)
+    elif args.function == '3':
+        verify_results(rtol=args.rtol, complex_values=args.complex_values, progress=args.progress)
\ No newline at end of file
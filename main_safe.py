@@ -2,25 +2,35 @@
 # -*- coding: utf-8 -*-
 
 import sys
-import os
 import json
-import signal
-import time
+import argparse
 sys.path.append('.')
 
 from fusion.operations import Operations
+from fusion.supervisor import WorkerSupervisor, STATUS_OK, STATUS_TIMEOUT, STATUS_MEMORY, STATUS_CRASHED
 from config import all_tricks
+from trick_rules.catalogue import TrickCatalogue
+from data.checkpoint import CheckpointLog
 
-def timeout_handler(signum, frame):
-    raise TimeoutError("操作超时")
 
-def main():
+def init_fusion_worker(seed=None):
+    # 每个工作进程各自构建 Operations 与技巧目录
+    ops = Operations()
+    return ops, TrickCatalogue(all_tricks, ops.local_dict), seed
+
+
+def fuse_formula(state, formula):
+    ops, catalogue, seed = state
+    if seed is not None:
+        # 与 main.fusion_seed 相同：按公式派生种子，结果与由哪个工作进程处理、是否断点续跑无关
+        ops.rng.seed(f"{seed}:{formula}")
+    return ops.execute_operations(formula, catalogue, complexity=30)
+
+
+def main(workers=1, timeout=60, memory_mb=None, max_tasks_per_worker=50, resume=False, seed=None):
     """主程序 - 安全版本"""
     print("开始运行安全版本的融合程序...")
     
-    # 创建Operations实例
-    ops = Operations()
-    
     # 转换sympy公式为字符串
     formula_strings = {}
     for formula, rule in all_tricks.items():
@@ -35,22 +45,48 @@ def main():
     print(f"成功转换了 {len(formula_strings)} 个公式")
     
     results = {}
+    timed_out = []
+    # 超出内存预算或工作进程崩溃（如被 OOM 杀掉）的公式，与超时一样单独记录
+    over_budget = []
     success_count = 0
     error_count = 0
     
-    for i, (formula, rule) in enumerate(formula_strings.items()):
-        print(f"\n处理公式 {i+1}/{len(formula_strings)}: {formula}")
+    # 追加式断点日志：每个公式完成后只追加它自己的结果；只有成功与超时的公式在续跑时被跳过，其余重新处理
+    checkpoint = CheckpointLog('data/tricks', 'fusion_results_safe',
+                               done_statuses=(STATUS_OK, STATUS_TIMEOUT)).open(resume=resume)
+    if resume:
+        for formula, (status, value) in checkpoint.records.items():
+            if status == STATUS_OK and value:
+                results[formula] = value
+            elif status == STATUS_TIMEOUT:
+                timed_out.append(formula)
+        pending = {f: r for f, r in formula_strings.items() if not checkpoint.is_done(f)}
+        print(f"从断点恢复: 跳过 {len(formula_strings) - len(pending)} 个已完成的公式")
+    else:
+        pending = formula_strings
+    
+    # 每个公式在可回收的工作进程中执行，超过时间或内存预算的进程被杀掉并替换
+    supervisor = WorkerSupervisor(
+        fuse_formula,
+        init_fn=init_fusion_worker,
+        initargs=(seed,),
+        workers=workers,
+        timeout=timeout,
+        memory_limit_mb=memory_mb,
+        max_tasks_per_worker=max_tasks_per_worker
+    )
+    
+    for i, (formula, status, formula_results) in enumerate(supervisor.map(pending)):
+        rule = formula_strings[formula]
+        print(f"\n处理公式 {i+1}/{len(pending)}: {formula}")
         
         try:
-            # 设置超时（60秒）
-            signal.signal(signal.SIGALRM, timeout_handler)
-            signal.alarm(60)
-            
-            # 执行操作
-            formula_results = ops.execute_operations(formula, all_tricks, complexity=30)
-            
-            # 取消超时
-            signal.alarm(0)
+            if status == STATUS_TIMEOUT:
+                raise TimeoutError("操作超时")
+            if status in (STATUS_MEMORY, STATUS_CRASHED):
+                raise MemoryError(f"超出内存预算或工作进程崩溃: {status}")
+            if status != STATUS_OK:
+                raise RuntimeError(f"工作进程失败: {status} {formula_results or ''}")
             
             if formula_results:
                 results[formula] = {
@@ -60,7 +96,7 @@ def main():
                 success_count += 1
                 
                 # 分析第一个结果
-                first_result = formula_results['0']
+                first_result = next(iter(formula_results.values()))
                 operands = first_result['fusion_operands']
                 print(f"  成功生成 {len(operands)} 个操作")
                 
@@ -103,28 +139,30 @@ def main():
                 
         except TimeoutError:
             print(f"  处理超时，跳过")
+            timed_out.append(formula)
+            error_count += 1
+        except MemoryError as e:
+            print(f"  {e}，跳过")
+            over_budget.append(formula)
             error_count += 1
-            signal.alarm(0)  # 取消超时
         except Exception as e:
             print(f"  处理失败: {e}")
             error_count += 1
-            signal.alarm(0)  # 取消超时
         
-        # 每处理10个公式保存一次中间结果
-        if (i + 1) % 10 == 0:
-            temp_file = f'data/tricks/fusion_results_temp_{i+1}.json'
-            with open(temp_file, 'w', encoding='utf-8') as f:
-                json.dump({"results": results}, f, ensure_ascii=False, indent=4)
-            print(f"  已保存中间结果到: {temp_file}")
+        checkpoint.append(formula, status, results.get(formula))
+    
+    checkpoint.close()
     
     # 保存最终结果
     output_file = 'data/tricks/fusion_results_safe.json'
     with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump({"results": results}, f, ensure_ascii=False, indent=4)
+        json.dump({"results": results, "timed_out": timed_out, "over_budget": over_budget},
+                  f, ensure_ascii=False, indent=4)
     
     print(f"\n程序完成!")
     print(f"成功处理: {success_count} 个公式")
-    print(f"处理失败: {error_count} 个公式")
+    print(f"处理失败: {error_count} 个公式（其中超时 {len(timed_out)} 个，超出内存预算或崩溃 {len(over_budget)} 个）")
+    print(f"工作进程重启次数: {supervisor.restarts}（另有计划回收 {supervisor.recycles} 次）")
     print(f"结果已保存到: {output_file}")
     
     # 分析结果
@@ -154,4 +192,13 @@ def main():
         print(f"符合要求的序列: {valid_sequences}")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='安全版本的融合程序')
+    parser.add_argument('--workers', type=int, default=1, help='number of worker processes')
+    parser.add_argument('--timeout', type=float, default=60, help='wall-clock budget per formula in seconds')
+    parser.add_argument('--memory-mb', type=int, default=None, help='address-space budget per worker in MB')
+    parser.add_argument('--max-tasks-per-worker', type=int, default=50, help='recycle a worker after this many formulas')
+    parser.add_argument('--resume', action='store_true', help='skip formulas already recorded in the checkpoint log')
+    parser.add_argument('--seed', type=int, default=None, help='base random seed; each formula gets its own derived seed')
+    args = parser.parse_args()
+    main(workers=args.workers, timeout=args.timeout, memory_mb=args.memory_mb,
+         max_tasks_per_worker=args.max_tasks_per_worker, resume=args.resume, seed=args.seed)
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+融合前结构去重的回归检查：构造一份含有项顺序、空白不同的重复公式的构造结果，
+经 main.collect_fusion_formulas 收集后检查丢弃数量与保留的写法
+用法: python scripts/dedup_check.py
+检查失败时以非零状态退出
+"""
+
+import json
+import os
+import sys
+import tempfile
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from config import all_tricks  # noqa: E402
+from main import collect_fusion_formulas  # noqa: E402
+
+
+# (首次出现的写法, 仅项顺序或空白不同的重复写法)
+DUPLICATES = [
+    ('a**2 + 2*a*b + b**2 = (a + b)**2', 'b**2+2*a*b+a**2=(b+a)**2'),
+    ('sin(α)*cos(β) + cos(α)*sin(β) = x', 'cos(β)*sin(α) + sin(β)*cos(α) = x'),
+]
+# 与 all_tricks 中公式只有项顺序不同的写法（all_tricks 在构造结果之后合并，构造结果中的写法先出现）
+TRICK_ORIGINAL = '(a+b)**2=a**2+2*a*b+b**2'
+TRICK_REORDERED = '(b+a)**2=b**2+2*a*b+a**2'
+# 结构不同的公式不应被去重
+DISTINCT = ['a**2 - b**2 = (a - b)*(a + b)', 'a**2 - b**2 = (a + b)*(a - b) + 0*a + 1']
+
+
+def main():
+    tricks = [{"formula_after": first} for first, _ in DUPLICATES]
+    tricks += [{"formula_after": duplicate} for _, duplicate in DUPLICATES]
+    tricks += [{"formula_after": TRICK_REORDERED}]
+    tricks += [{"formula_after": formula} for formula in DISTINCT]
+    record = {"rule_name": "squa_diff", "results": [{"complexity": 3, "tricks": tricks}]}
+
+    with tempfile.TemporaryDirectory() as directory:
+        construction_file = os.path.join(directory, 'construct_result_all.jsonl')
+        with open(construction_file, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        formulas, complexity, dropped = collect_fusion_formulas(construction_file)
+
+    failures = []
+    expected_dropped = len(DUPLICATES) + 1
+    if TRICK_ORIGINAL not in all_tricks:
+        failures.append(f"all_tricks 中没有 {TRICK_ORIGINAL}，检查数据需要更新")
+    if dropped != expected_dropped:
+        failures.append(f"丢弃了 {dropped} 个重复公式，应为 {expected_dropped}")
+    for first, duplicate in DUPLICATES:
+        if first not in formulas or duplicate in formulas:
+            failures.append(f"应保留首次出现的 {first!r} 并丢弃 {duplicate!r}")
+    if TRICK_REORDERED not in formulas or TRICK_ORIGINAL in formulas:
+        failures.append("与 all_tricks 重复的公式应保留先出现的构造结果写法")
+    for formula in DISTINCT:
+        if formula not in formulas:
+            failures.append(f"结构不同的公式被错误丢弃: {formula!r}")
+
+    print(f"收集 {len(formulas)} 个公式，丢弃 {dropped} 个重复公式")
+    for failure in failures:
+        print(failure)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
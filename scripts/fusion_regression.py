@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+融合操作的回归检查：在内置技巧上以固定种子运行 Operations.execute_operations，
+- 操作 4（替换）、6（幂次）的每条结果平均接受次数，以及拼接、替换、幂次各至少 3 次的结果所占比例，
+  不应明显低于按字符串长度限制的原实现（BASELINE，同样的种子与技巧）；
+  原实现的字符串替换常常找不到可替换的片段，略高于 BASELINE 不算回退；
+- 输入本身超出结构预算（幂嵌套过深）时不生成结果；
+- 所有结果都是 "左侧 = 右侧" 形式的等式，不出现 "Eq(...)"
+用法: python scripts/fusion_regression.py [--seeds 0 1 2 3] [--tolerance 0.2]
+检查失败时以非零状态退出
+"""
+
+import argparse
+import os
+import sys
+from collections import Counter
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from config import all_tricks  # noqa: E402
+from fusion.operations import Operations  # noqa: E402
+from trick_rules.catalogue import TrickCatalogue  # noqa: E402
+
+
+# 原实现在种子 0-3 上的统计（共 544 条结果）：每条结果的平均接受次数、三类操作各至少 3 次的结果比例
+BASELINE = {
+    'replace': 1160 / 544,
+    'power': 711 / 544,
+    'full': 215 / 544,
+}
+# 幂嵌套 5 层，超出默认预算的 max_pow_depth
+DEEP_POWER_TOWER = 'a**(b**(c**(d**(e**k)))) = x + y'
+
+
+def run_fusion(ops, catalogue, formulas, seed):
+    """每个公式以 "种子:公式" 为种子运行一次融合，逐个产出 (公式, 结果)"""
+    for formula in formulas:
+        ops.rng.seed(f"{seed}:{formula}")
+        for result in ops.execute_operations(formula, catalogue, complexity=None).values():
+            yield formula, result
+
+
+def malformed_results(formula, result):
+    """结果中不是 "左侧 = 右侧" 形式的操作结果"""
+    return [
+        f"{formula}: 操作 {operand['operation']} 的结果 {operand['result'][:80]!r}"
+        for operand in result['fusion_operands']
+        if '=' not in operand['result'] or operand['result'].startswith('Eq(')
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='融合操作回归检查')
+    parser.add_argument('--seeds', type=int, nargs='+', default=[0, 1, 2, 3])
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed relative drop of the acceptance rates below the baseline')
+    args = parser.parse_args()
+
+    ops = Operations()
+    catalogue = TrickCatalogue(all_tricks, ops.local_dict)
+    failures = []
+
+    sequences = 0
+    accepted = Counter()
+    for seed in args.seeds:
+        for formula, result in run_fusion(ops, catalogue, all_tricks, seed):
+            sequences += 1
+            operations = [operand['operation'] for operand in result['fusion_operands']]
+            accepted['replace'] += operations.count(4)
+            accepted['power'] += operations.count(6)
+            if all(operations.count(operation) >= 3 for operation in (2, 4, 6)):
+                accepted['full'] += 1
+            failures.extend(malformed_results(formula, result))
+
+    if not sequences:
+        failures.append("内置技巧没有产生任何融合结果")
+    for name, baseline in BASELINE.items():
+        rate = accepted[name] / sequences if sequences else 0.0
+        print(f"{name}: {rate:.3f} (baseline {baseline:.3f})")
+        if rate < (1 - args.tolerance) * baseline:
+            failures.append(f"{name} 的接受率 {rate:.3f} 比原实现 {baseline:.3f} 低了 {args.tolerance:.0%} 以上")
+
+    deep_results = [item for seed in args.seeds
+                    for item in run_fusion(ops, catalogue, [DEEP_POWER_TOWER], seed)]
+    if deep_results:
+        failures.append(f"超出结构预算的输入仍生成了 {len(deep_results)} 条结果")
+    for formula, result in deep_results:
+        failures.extend(malformed_results(formula, result))
+
+    print(f"{sequences} 条融合结果")
+    for failure in failures:
+        print(failure)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+启动耗时基准：测量 `python main.py --function 0` 从启动到退出的耗时，并检查导入 main 时没有加载重型模块
+用法: python scripts/startup_benchmark.py [--runs 10] [--budget 0.3]
+超过预算或导入 main 时加载了 sympy 等模块则以非零状态退出
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 导入 main 时不应加载的模块
+HEAVY_MODULES = ('sympy', 'config', 'fusion.operations', 'trick_rules.rule_module')
+
+IMPORT_CHECK = (
+    "import sys, main; "
+    f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+)
+
+
+def time_cli(runs):
+    """多次运行 --function 0，返回每次的耗时（秒）"""
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, 'main.py', '--function', '0'], cwd=project_root,
+                       check=True, stdout=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def loaded_heavy_modules():
+    """在新进程中导入 main，返回被一并加载的重型模块"""
+    output = subprocess.run([sys.executable, '-c', IMPORT_CHECK], cwd=project_root,
+                            check=True, capture_output=True, text=True).stdout.strip()
+    return [name for name in output.split(',') if name]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='main.py 启动耗时基准')
+    parser.add_argument('--runs', type=int, default=10, help='number of timed runs')
+    parser.add_argument('--budget', type=float, default=0.3, help='max allowed median startup time in seconds')
+    args = parser.parse_args()
+
+    timings = time_cli(args.runs)
+    median = statistics.median(timings)
+    print(f"main.py --function 0: median {median * 1000:.1f} ms, "
+          f"min {min(timings) * 1000:.1f} ms, max {max(timings) * 1000:.1f} ms ({args.runs} runs)")
+
+    failed = False
+    heavy = loaded_heavy_modules()
+    if heavy:
+        print(f"导入 main 时加载了重型模块: {', '.join(heavy)}")
+        failed = True
+    if median > args.budget:
+        print(f"启动耗时超过预算 {args.budget:.3f} s")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,46 +1,50 @@
-from .rule_module import FormulaManipulator
-from trick_rules import cubi_sum_diff
-from trick_rules import indu_form
-from trick_rules import perf_cube_n_the_form
-from trick_rules import prod_n_diff
-from trick_rules import squa_diff
-from trick_rules import sum_n_diff_of_two_angl
-from trick_rules import sum_n_diff_prod
-from trick_rules import sum_of_perf_squa_n_diff
+import importlib
+import logging
 
+from .registry import RuleRegistry
+
+
+logger = logging.getLogger(__name__)
+
+# 规则模块在首次访问时才导入，import trick_rules 本身不加载 sympy 与各规则
+RULE_MODULES = (
+    'cubi_sum_diff',
+    'indu_form',
+    'perf_cube_n_the_form',
+    'prod_n_diff',
+    'squa_diff',
+    'sum_n_diff_of_two_angl',
+    'sum_n_diff_prod',
+    'sum_of_perf_squa_n_diff',
+)
+
+
+def __getattr__(name):
+    # 兼容 trick_rules.FormulaManipulator 与 trick_rules.<规则模块> 的写法
+    if name == 'FormulaManipulator':
+        from .rule_module import FormulaManipulator
+        return FormulaManipulator
+    if name in RULE_MODULES:
+        return importlib.import_module(f'.{name}', __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+
+# 进程级规则注册表，内置规则以 'module:class' 形式登记，首次使用时才导入
+rule_registry = RuleRegistry()
+for _name in RULE_MODULES:
+    rule_registry.register(_name, f'{__name__}.{_name}:{_name}')
+
+
+def register_rule(name, factory=None):
+    """注册新规则，可直接调用或作为类装饰器使用"""
+    return rule_registry.register(name, factory)
 
 
 def get_generator(name, data):
-    if name == "arit_prog":
-        generator = arit_prog.arit_prog()
-        return generator.run(data)
-    elif name == "cubi_sum_diff":
-        generator = cubi_sum_diff.cubi_sum_diff()
-        return generator.run(data)
-    elif name == "geom_prog":
-        generator = geom_prog.geom_prog()
-        return generator.run(data)
-    elif name == "indu_form":
-        generator = indu_form.indu_form()
-        return generator.run(data)
-    elif name == "perf_cube_n_the_form":
-        generator = perf_cube_n_the_form.perf_cube_n_the_form()
-        return generator.run(data)
-    elif name == "prod_n_diff":
-        generator = prod_n_diff.prod_n_diff()
-        return generator.run(data)
-    elif name == "squa_diff":
-        generator = squa_diff.squa_diff()
-        return generator.run(data)
-    elif name == "sum_n_diff_of_two_angl":
-        generator = sum_n_diff_of_two_angl.sum_n_diff_of_two_angl()
-        return generator.run(data)
-    elif name == "sum_n_diff_prod":
-        generator = sum_n_diff_prod.sum_n_diff_prod()
-        return generator.run(data)
-    elif name == "sum_of_perf_squa_n_diff":
-        generator = sum_of_perf_squa_n_diff.sum_of_perf_squa_n_diff()
-        return generator.run(data)
-    else:
-        print(f"未知的规则名称: {name}")
-        return None
\ No newline at end of file
+    # 同一规则的生成器实例在进程内复用
+    generator = rule_registry.get(name)
+    if generator is None:
+        logger.warning("未知的规则名称: %s", name)
+        return None
+    return generator.run(data)
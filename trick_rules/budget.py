@@ -0,0 +1,124 @@
+import math
+
+import sympy as sp
+
+
+class ExprSize:
+    """
+    表达式树的规模：节点数、深度、幂嵌套层数（任一路径上 Pow 节点的最大个数）
+    组合方法只根据操作数的规模推算结果规模，不需要先构造结果表达式或字符串
+    """
+
+    __slots__ = ('nodes', 'depth', 'pow_depth')
+
+    def __init__(self, nodes=1, depth=1, pow_depth=0):
+        self.nodes = nodes
+        self.depth = depth
+        self.pow_depth = pow_depth
+
+    @classmethod
+    def of(cls, expr):
+        """遍历一次 SymPy 表达式统计规模（显式栈，深层幂塔不会触发递归限制）"""
+        nodes = depth = pow_depth = 0
+        stack = [(expr, 1, 0)]
+        while stack:
+            node, level, pows = stack.pop()
+            nodes += 1
+            if isinstance(node, sp.Pow):
+                pows += 1
+            depth = max(depth, level)
+            pow_depth = max(pow_depth, pows)
+            stack.extend((arg, level + 1, pows) for arg in node.args)
+        return cls(nodes, depth, pow_depth)
+
+    def plus(self, *others):
+        """self 与 others 相加后的规模（新增一个 Add 节点）"""
+        parts = (self,) + others
+        return ExprSize(sum(part.nodes for part in parts) + 1,
+                        max(part.depth for part in parts) + 1,
+                        max(part.pow_depth for part in parts))
+
+    def raised_by(self, base):
+        """base ** self 的规模"""
+        return ExprSize(base.nodes + self.nodes + 1,
+                        max(base.depth, self.depth) + 1,
+                        max(base.pow_depth, self.pow_depth) + 1)
+
+    def substituted(self, replacement, count=1):
+        """把 count 个叶子替换为 replacement 后的规模（深度与幂嵌套取上界）"""
+        return ExprSize(self.nodes + count * (replacement.nodes - 1),
+                        self.depth + replacement.depth - 1,
+                        self.pow_depth + replacement.pow_depth)
+
+    def __repr__(self):
+        return f"ExprSize(nodes={self.nodes}, depth={self.depth}, pow_depth={self.pow_depth})"
+
+
+# 叶子（数字或单个符号）的规模
+LEAF = ExprSize()
+
+
+class StructuralBudget:
+    """
+    融合结果的结构预算，取代原来按字符串长度的检查
+    各上限按内置技巧与融合结果上实测的约 2.35 个字符对应一个节点换算：
+    max_nodes/max_depth/max_pow_depth 约束整个等式（左右两侧之和或最大值），max_nodes 对应原结果 1000 字符的上限；
+    max_replace_nodes、max_power_nodes 分别对应原 replace_with_formula 右侧 200 字符、power_transform 300 字符的输入上限；
+    拼接、替换推算的规模偏大，推算值不超过这两个上限的 estimate_slack 倍时在进入该阶段前解析实测；
+    max_collect_nodes 对应原 combining_similar_terms 500 字符的输入上限；
+    多项式部分只有在展开后的项数与总次数（按 expansion_bound 估计）不超过 max_collect_terms、
+    max_collect_degree 时才展开合并，合并结果仍须满足整体预算
+    """
+
+    def __init__(self, max_nodes=425, max_depth=24, max_pow_depth=4,
+                 max_replace_nodes=85, max_power_nodes=128, max_collect_nodes=210,
+                 max_collect_terms=200, max_collect_degree=16, estimate_slack=2.0):
+        self.max_nodes = max_nodes
+        self.max_depth = max_depth
+        self.max_pow_depth = max_pow_depth
+        self.max_replace_nodes = max_replace_nodes
+        self.max_power_nodes = max_power_nodes
+        self.max_collect_nodes = max_collect_nodes
+        self.max_collect_terms = max_collect_terms
+        self.max_collect_degree = max_collect_degree
+        self.estimate_slack = estimate_slack
+
+    def allows(self, sizes):
+        """sizes 为 (左侧规模, 右侧规模)；规模未知（None）时视为超出预算"""
+        if sizes is None or None in sizes:
+            return False
+        left, right = sizes
+        return (left.nodes + right.nodes <= self.max_nodes
+                and max(left.depth, right.depth) <= self.max_depth
+                and max(left.pow_depth, right.pow_depth) <= self.max_pow_depth)
+
+
+def expansion_bound(expr, max_exponent=64):
+    """
+    多项式 expr 完全展开后的 (项数上界, 总次数上界)，不做展开
+    n 次幂的项数按 t 项的 n 次齐次单项式个数 C(t+n-1, n) 估计；指数超过 max_exponent 时项数记为无穷
+    """
+    if expr.is_Add:
+        bounds = [expansion_bound(arg, max_exponent) for arg in expr.args]
+        return sum(terms for terms, _ in bounds), max(degree for _, degree in bounds)
+    if expr.is_Mul:
+        terms, degree = 1, 0
+        for arg in expr.args:
+            arg_terms, arg_degree = expansion_bound(arg, max_exponent)
+            terms *= arg_terms
+            degree += arg_degree
+        return terms, degree
+    if expr.is_Pow and expr.exp.is_Integer and expr.exp >= 0:
+        terms, degree = expansion_bound(expr.base, max_exponent)
+        n = int(expr.exp)
+        if n > max_exponent:
+            return math.inf, degree * n
+        return math.comb(terms + n - 1, n) if terms != math.inf else math.inf, degree * n
+    if expr.is_Symbol:
+        return 1, 1
+    return 1, 0
+
+
+def equation_sizes(lhs, rhs):
+    """等式左右两侧的规模"""
+    return ExprSize.of(lhs), ExprSize.of(rhs)
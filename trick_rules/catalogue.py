@@ -0,0 +1,155 @@
+from collections import OrderedDict
+
+from .parse_cache import formula_cache, namespace_of
+from .budget import ExprSize
+
+
+class TrickEntry:
+    """技巧公式条目：预先拆分好的左右两侧，表达式与自由符号在首次使用时解析并缓存"""
+
+    __slots__ = ('formula', 'rule', 'left', 'right', '_local_dict', '_parsed', '_sizes')
+
+    def __init__(self, formula, rule, local_dict):
+        self.formula = formula
+        self.rule = rule
+        left, right = formula.split('=', 1)
+        self.left = left.strip()
+        self.right = right.strip()
+        self._local_dict = local_dict
+        self._parsed = None
+        self._sizes = None
+
+    def _parse(self):
+        if self._parsed is None:
+            try:
+                _, lhs, rhs = formula_cache.parse(self.formula, self._local_dict,
+                                                  namespace=namespace_of(self._local_dict))
+                self._parsed = (lhs, rhs, frozenset(lhs.free_symbols | rhs.free_symbols))
+            except Exception:
+                # 无法解析的技巧只参与字符串层面的操作
+                self._parsed = (None, None, frozenset())
+        return self._parsed
+
+    @property
+    def lhs_expr(self):
+        return self._parse()[0]
+
+    @property
+    def rhs_expr(self):
+        return self._parse()[1]
+
+    @property
+    def free_symbols(self):
+        return self._parse()[2]
+
+    @property
+    def sizes(self):
+        """(左侧规模, 右侧规模)，无法解析的一侧为 None"""
+        if self._sizes is None:
+            lhs, rhs, _ = self._parse()
+            self._sizes = (ExprSize.of(lhs) if lhs is not None else None,
+                           ExprSize.of(rhs) if rhs is not None else None)
+        return self._sizes
+
+
+# cached() 的进程级缓存：(id(技巧集合), 符号表) -> (技巧集合, 目录)
+# dict/list 不支持弱引用，这里保留对技巧集合的强引用，保证 id 不会被复用；最多保留 _CACHE_SIZE 个
+_catalogue_cache = OrderedDict()
+_CACHE_SIZE = 8
+
+
+class TrickCatalogue:
+    """
+    不可变的技巧目录，每轮运行构建一次
+    预先拆分所有等式并按右侧长度分桶，融合操作可以 O(1) 随机抽取，无需每次扫描 all_tricks
+    by_symbol 给出 自由符号 -> 右侧含该符号的条目 的倒排索引，首次使用时才解析各条目
+    """
+
+    def __init__(self, all_tricks, local_dict, length_limits=(30, 50)):
+        entries = []
+        for formula in all_tricks:
+            if '=' in formula:
+                rule = all_tricks[formula] if isinstance(all_tricks, dict) else None
+                entries.append(TrickEntry(formula, rule, local_dict))
+        self._entries = tuple(entries)
+        self._formulas = tuple(entry.formula for entry in self._entries)
+        # 右侧长度 < limit 的条目
+        self._short_rhs = {
+            limit: tuple(entry for entry in self._entries if len(entry.right) < limit)
+            for limit in length_limits
+        }
+        self._symbol_index = {}
+        self._substitutions = None
+
+    @classmethod
+    def ensure(cls, all_tricks, local_dict):
+        """已是目录则原样返回，否则由 dict/list 构建"""
+        if isinstance(all_tricks, cls):
+            return all_tricks
+        return cls(all_tricks, local_dict)
+
+    @classmethod
+    def cached(cls, all_tricks, local_dict):
+        """
+        同一技巧集合对象（按身份）只构建一次目录，之后的调用为 O(1)
+        技巧集合在一次运行中视为不可变，构建后再修改不会反映到目录中
+        """
+        if isinstance(all_tricks, cls):
+            return all_tricks
+        key = (id(all_tricks), namespace_of(local_dict))
+        cached = _catalogue_cache.get(key)
+        if cached is not None and cached[0] is all_tricks:
+            _catalogue_cache.move_to_end(key)
+            return cached[1]
+        catalogue = cls(all_tricks, local_dict)
+        _catalogue_cache[key] = (all_tricks, catalogue)
+        if len(_catalogue_cache) > _CACHE_SIZE:
+            _catalogue_cache.popitem(last=False)
+        return catalogue
+
+    @property
+    def entries(self):
+        return self._entries
+
+    @property
+    def formulas(self):
+        return self._formulas
+
+    def short_rhs(self, limit):
+        """右侧长度小于 limit 的条目，limit 须为构建时给出的分桶之一"""
+        return self._short_rhs[limit]
+
+    def by_symbol(self, limit):
+        """右侧长度小于 limit 的条目按右侧自由符号建立的倒排索引，条目保持目录顺序"""
+        index = self._symbol_index.get(limit)
+        if index is None:
+            index = {}
+            for entry in self._short_rhs[limit]:
+                if entry.rhs_expr is None:
+                    continue
+                for symbol in entry.rhs_expr.free_symbols:
+                    index.setdefault(symbol, []).append(entry)
+            index = {symbol: tuple(entries) for symbol, entries in index.items()}
+            self._symbol_index[limit] = index
+        return index
+
+    def substitutions(self):
+        """左右两侧都能解析的条目的 (左侧表达式, 右侧表达式)，首次使用时解析一次"""
+        if self._substitutions is None:
+            self._substitutions = tuple(
+                (entry.lhs_expr, entry.rhs_expr) for entry in self._entries
+                if entry.lhs_expr is not None and entry.rhs_expr is not None
+            )
+        return self._substitutions
+
+    def keys(self):
+        return self._formulas
+
+    def __iter__(self):
+        return iter(self._formulas)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __getitem__(self, index):
+        return self._entries[index]
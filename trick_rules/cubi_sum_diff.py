@@ -1,8 +1,11 @@
 from .rule_module import FormulaManipulator
+import logging
+
+logger = logging.getLogger(__name__)
 
 class cubi_sum_diff(FormulaManipulator):
-    def __init__(self):
-        super().__init__()
+    def __init__(self, rng=None):
+        super().__init__(rng=rng)
         self.set_allowed_operations([1, 2, 3, 4, 5, 6])
 
     def run(self, data):
@@ -10,8 +13,8 @@ class cubi_sum_diff(FormulaManipulator):
         
         # 解析输入的公式
         expr, variables = self.parse_user_formula(data)
-        print(f"处理公式: {data}")
-        print(f"变量列表: {[str(v) for v in variables]}")
+        logger.debug("处理公式: %s", data)
+        logger.debug("变量列表: %s", variables)
         
         # 执行变换操作
         results = self.execute_functions(data)
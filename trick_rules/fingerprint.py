@@ -0,0 +1,82 @@
+import hashlib
+
+import sympy as sp
+
+from .parse_cache import formula_cache, namespace_of
+
+
+# 参数顺序不影响语义的节点，指纹中对其子节点排序
+COMMUTATIVE_TYPES = (sp.Add, sp.Mul)
+
+
+def _digest(*parts):
+    h = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        h.update(part.encode('utf-8'))
+        h.update(b'\x00')
+    return h.hexdigest()
+
+
+def structure_fingerprint(expr):
+    """
+    计算 SymPy 表达式树的结构指纹
+    Add/Mul 的子节点先展平同类嵌套再排序，因此仅项的顺序或空白不同的公式得到相同指纹
+    使用显式栈后序遍历，深层幂塔不会触发递归深度限制
+    """
+    digests = {}
+    stack = [(expr, False)]
+    while stack:
+        node, visited = stack.pop()
+        if node in digests:
+            continue
+        if not node.args:
+            digests[node] = _digest(type(node).__name__, str(node))
+            continue
+        if not visited:
+            stack.append((node, True))
+            stack.extend((arg, False) for arg in node.args if arg not in digests)
+            continue
+
+        if isinstance(node, COMMUTATIVE_TYPES):
+            children = []
+            for arg in node.args:
+                # 展平 evaluate=False 时产生的 Add(Add(a, b), c) 之类嵌套
+                if arg.func == node.func:
+                    children.extend(digests[arg].split('|', 1)[1].split(','))
+                else:
+                    children.append(digests[arg])
+            children.sort()
+        else:
+            children = [digests[arg] for arg in node.args]
+        name = getattr(node.func, '__name__', str(node.func))
+        # 保留子节点摘要，供父节点展平同类嵌套
+        digests[node] = _digest(name, *children) + '|' + ','.join(children)
+    return digests[expr].split('|', 1)[0]
+
+
+def formula_fingerprint(formula_str, local_dict):
+    """公式字符串的结构指纹，无法解析时退化为去除空白后的字符串"""
+    try:
+        expr, _, _ = formula_cache.parse(formula_str, local_dict, evaluate=False,
+                                         namespace=namespace_of(local_dict))
+        return structure_fingerprint(expr)
+    except Exception:
+        return formula_cache.normalize(formula_str)
+
+
+class FormulaDeduplicator:
+    """按结构指纹去重，记录被丢弃的重复公式数量"""
+
+    def __init__(self, local_dict):
+        self.local_dict = local_dict
+        self.seen = set()
+        self.dropped = 0
+
+    def add(self, formula_str):
+        """首次出现返回 True，重复返回 False"""
+        fingerprint = formula_fingerprint(formula_str, self.local_dict)
+        if fingerprint in self.seen:
+            self.dropped += 1
+            return False
+        self.seen.add(fingerprint)
+        return True
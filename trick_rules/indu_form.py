@@ -1,10 +1,12 @@
-import random
 import re
 from .rule_module import FormulaManipulator
+import logging
+
+logger = logging.getLogger(__name__)
 
 class indu_form(FormulaManipulator):
-    def __init__(self):
-        super().__init__()
+    def __init__(self, rng=None):
+        super().__init__(rng=rng)
         self.set_allowed_operations([1, 2, 3, 4, 5, 6])
 
     def swap_factors(expr_str):
@@ -26,7 +28,7 @@ class indu_form(FormulaManipulator):
         min_val, max_val = 1, 100
 
         # 随机选择一个数字
-        random_number = random.randint(min_val, max_val)
+        random_number = self.rng.randint(min_val, max_val)
 
         # 替换等式中的'k'字符为随机数字
         user_formula_k = formula.replace('k', str(random_number))
@@ -38,8 +40,8 @@ class indu_form(FormulaManipulator):
         
         # 解析输入的公式
         expr, variables = self.parse_user_formula(data)
-        print(f"处理公式: {data}")
-        print(f"变量列表: {[str(v) for v in variables]}")
+        logger.debug("处理公式: %s", data)
+        logger.debug("变量列表: %s", variables)
         
         # 执行变换操作
         results = self.execute_functions(data)
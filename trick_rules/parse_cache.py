@@ -0,0 +1,88 @@
+import re
+from collections import OrderedDict
+
+import sympy as sp
+
+
+class FormulaParseCache:
+    """有界 LRU 解析缓存，按规范化后的公式字符串缓存 sympify 结果"""
+
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    @staticmethod
+    def normalize(formula_str):
+        # 去掉空白并统一等号，使仅空格不同的公式命中同一条缓存
+        formula_str = str(formula_str).replace('==', '=')
+        return re.sub(r'\s+', '', formula_str)
+
+    def parse(self, formula_str, local_dict, evaluate=True, namespace='base'):
+        """
+        解析公式，返回 (expr, lhs, rhs)
+        含等号时 expr 为 sp.Eq(lhs, rhs, evaluate=False)，否则 lhs 与 rhs 均为 None
+        namespace 用于区分不同的符号表，解析结果依赖 local_dict 的内容
+        """
+        key = (self.normalize(formula_str), evaluate, namespace)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry
+
+        self.misses += 1
+        text = str(formula_str).replace('==', '=').strip()
+        if '=' in text:
+            left, right = text.split('=', 1)
+            lhs = sp.sympify(left.strip(), locals=local_dict, evaluate=evaluate)
+            rhs = sp.sympify(right.strip(), locals=local_dict, evaluate=evaluate)
+            entry = (sp.Eq(lhs, rhs, evaluate=False), lhs, rhs)
+        else:
+            entry = (sp.sympify(text, locals=local_dict, evaluate=evaluate), None, None)
+
+        self._entries[key] = entry
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return entry
+
+    def resize(self, maxsize):
+        self.maxsize = maxsize
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self):
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+        }
+
+
+def namespace_of(local_dict):
+    # 共享的 SymbolNamespace 自带名称；普通 dict 按是否含希腊字母英文名区分
+    name = getattr(local_dict, 'name', None)
+    if name is not None:
+        return name
+    return 'extended' if 'alpha' in local_dict else 'base'
+
+
+# FormulaManipulator 与 Operations 共享的进程级缓存
+formula_cache = FormulaParseCache()
+
+
+def set_cache_size(maxsize):
+    formula_cache.resize(maxsize)
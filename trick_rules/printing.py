@@ -0,0 +1,22 @@
+import sympy as sp
+from sympy.printing.str import StrPrinter
+
+
+class MemoStrPrinter(StrPrinter):
+    """
+    记住已打印子树的 StrPrinter，输出与 sp.sstr 相同
+    构造记录中后一步的结果通常把前一步整棵包在 Mul/Add/Pow 里，同一条记录共用一个打印器时每棵子树只打印一次
+    """
+
+    def __init__(self, settings=None):
+        super().__init__(settings)
+        self._memo = {}
+
+    def _print(self, expr, **kwargs):
+        if kwargs or not isinstance(expr, sp.Basic):
+            return super()._print(expr, **kwargs)
+        text = self._memo.get(expr)
+        if text is None:
+            text = super()._print(expr)
+            self._memo[expr] = text
+        return text
@@ -0,0 +1,75 @@
+import importlib
+import logging
+from importlib import metadata
+
+
+logger = logging.getLogger(__name__)
+
+# 第三方包通过该入口点组注册新规则，例如在 setup.py 中：
+# entry_points={'trick_rules.rules': ['my_rule = my_pkg.my_rule:my_rule']}
+ENTRY_POINT_GROUP = 'trick_rules.rules'
+
+
+class RuleRegistry:
+    """
+    规则名 -> 生成器的注册表
+    注册时只记录工厂（类、可调用对象或 'module:attr' 字符串），首次 get 时才导入并实例化，
+    之后同一进程内复用该实例，重复调用 run(data) 不再重建 FormulaManipulator
+    """
+
+    def __init__(self, entry_point_group=ENTRY_POINT_GROUP):
+        self.entry_point_group = entry_point_group
+        self._factories = {}
+        self._instances = {}
+        self._entry_points_loaded = False
+
+    def register(self, name, factory=None):
+        """注册规则；省略 factory 时作为类装饰器使用"""
+        if factory is None:
+            def decorator(cls):
+                self.register(name, cls)
+                return cls
+            return decorator
+        self._factories[name] = factory
+        self._instances.pop(name, None)
+        return factory
+
+    def load_entry_points(self):
+        """读取已安装包在入口点组中声明的规则，代码中已注册的同名规则优先"""
+        if self._entry_points_loaded:
+            return
+        self._entry_points_loaded = True
+        try:
+            entry_points = metadata.entry_points(group=self.entry_point_group)
+        except Exception as e:
+            logger.warning("读取规则入口点失败: %s", e)
+            return
+        for entry_point in entry_points:
+            self._factories.setdefault(entry_point.name, entry_point.value)
+
+    def names(self):
+        self.load_entry_points()
+        return sorted(self._factories)
+
+    def __contains__(self, name):
+        if name not in self._factories:
+            self.load_entry_points()
+        return name in self._factories
+
+    def get(self, name):
+        """返回规则生成器实例，未注册的规则返回 None"""
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+        if name not in self:
+            return None
+        instance = self._resolve(self._factories[name])()
+        self._instances[name] = instance
+        return instance
+
+    @staticmethod
+    def _resolve(factory):
+        if not isinstance(factory, str):
+            return factory
+        module_name, _, attr = factory.partition(':')
+        return getattr(importlib.import_module(module_name), attr)
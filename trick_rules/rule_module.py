@@ -1,224 +1,108 @@
 import sympy as sp
 import random
 import re
-from thefuzz import fuzz 
+import logging
 import sys
 sys.path.append('..')
 from config import all_tricks
 from sympy.logic.boolalg import Boolean 
+from .parse_cache import formula_cache, namespace_of
+from .tree_edit_distance import LabeledTree, as_tree, tree_similarity
+from .structure import CompactStructure
+from .catalogue import TrickCatalogue
+from .printing import MemoStrPrinter
+from .symbols import BASE_NAMESPACE, EXTENDED_NAMESPACE, ordered_symbols
+
+
+logger = logging.getLogger(__name__)
 
 
 class FormulaManipulator:
-    def __init__(self):
+    def __init__(self, rng=None):
+        # 所有随机操作都使用注入的随机数生成器，未注入时使用独立的 random.Random 实例
+        self.rng = rng if rng is not None else random.Random()
         self.variable_library = list('ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz') + \
                                [chr(i) for i in range(0x03B1, 0x03C9 + 1)]
         self.operations_list = [1, 2, 3, 4, 5, 6, 7, 8, 9]
-        self.local_dict = {
-            # 三角函数
-            'sin': sp.Function('sin'),
-            'cos': sp.Function('cos'),
-            'tan': sp.Function('tan'),
-            'cot': sp.Function('cot'),
-
-            # 小写希腊字母
-            'π': sp.Symbol('π'),          # \u03C0
-            'α': sp.Symbol('α'),          # \u03B1
-            'β': sp.Symbol('β'),          # \u03B2
-            'γ': sp.Symbol('γ'),          # \u03B3
-            'δ': sp.Symbol('δ'),          # \u03B4
-            'ε': sp.Symbol('ε'),          # \u03B5
-            'ζ': sp.Symbol('ζ'),          # \u03B6
-            'η': sp.Symbol('η'),          # \u03B7
-            'θ': sp.Symbol('θ'),          # \u03B8
-            'ι': sp.Symbol('ι'),          # \u03B9
-            'κ': sp.Symbol('κ'),          # \u03BA
-            'λ': sp.Symbol('λ'),          # \u03BB
-            'μ': sp.Symbol('μ'),          # \u03BC
-            'ν': sp.Symbol('ν'),          # \u03BD
-            'ξ': sp.Symbol('ξ'),          # \u03BE
-            'ο': sp.Symbol('ο'),          # \u03BF
-            'ρ': sp.Symbol('ρ'),          # \u03C1
-            'σ': sp.Symbol('σ'),          # \u03C3
-            'τ': sp.Symbol('τ'),          # \u03C4
-            'υ': sp.Symbol('υ'),          # \u03C5
-            'φ': sp.Symbol('φ'),          # \u03C6
-            'χ': sp.Symbol('χ'),          # \u03C7
-            'ψ': sp.Symbol('ψ'),          # \u03C8
-            'ω': sp.Symbol('ω'),          # \u03C9
-
-            # 大写希腊字母
-            'Α': sp.Symbol('Α'),          # \u0391
-            'Β': sp.Symbol('Β'),          # \u0392
-            'Γ': sp.Symbol('Γ'),          # \u0393
-            'Δ': sp.Symbol('Δ'),          # \u0394
-            'Θ': sp.Symbol('Θ'),          # \u0398
-            'Λ': sp.Symbol('Λ'),          # \u039B
-            'Σ': sp.Symbol('Σ'),          # \u03A3
-            'Ω': sp.Symbol('Ω'),          # \u03A9
-            
-            # 基础变量
-            'a': sp.Symbol('a'),
-            'b': sp.Symbol('b'),
-            'c': sp.Symbol('c'),
-            'd': sp.Symbol('d'),
-            'e': sp.Symbol('e'),
-            'f': sp.Symbol('f'),
-            'g': sp.Symbol('g'),
-            'h': sp.Symbol('h'),
-            'i': sp.Symbol('i'),
-            'j': sp.Symbol('j'),
-            'k': sp.Symbol('k'),
-            'l': sp.Symbol('l'),
-            'm': sp.Symbol('m'),
-            'n': sp.Symbol('n'),
-            'o': sp.Symbol('o'),
-            'p': sp.Symbol('p'),
-            'q': sp.Symbol('q'),
-            'r': sp.Symbol('r'),
-            's': sp.Symbol('s'),
-            't': sp.Symbol('t'),
-            'u': sp.Symbol('u'),
-            'v': sp.Symbol('v'),
-            'w': sp.Symbol('w'),
-            'x': sp.Symbol('x'),
-            'y': sp.Symbol('y'),
-            'z': sp.Symbol('z'),
-            'A': sp.Symbol('A'),
-            'B': sp.Symbol('B'),
-            'C': sp.Symbol('C'),
-            'D': sp.Symbol('D'),
-            'E': sp.Symbol('E'),
-            'F': sp.Symbol('F'),
-            'G': sp.Symbol('G'),
-            'H': sp.Symbol('H'),
-            'I': sp.Symbol('I'),
-            'J': sp.Symbol('J'),
-            'K': sp.Symbol('K'),
-            'L': sp.Symbol('L'),
-            'M': sp.Symbol('M'),
-            'N': sp.Symbol('N'),
-            'O': sp.Symbol('O'),
-            'P': sp.Symbol('P'),
-            'Q': sp.Symbol('Q'),
-            'R': sp.Symbol('R'),
-            'S': sp.Symbol('S'),
-            'T': sp.Symbol('T'),
-            'U': sp.Symbol('U'),
-            'V': sp.Symbol('V'),
-            'W': sp.Symbol('W'),
-            'X': sp.Symbol('X'),
-            'Y': sp.Symbol('Y'),
-            'Z': sp.Symbol('Z')
-            
-        }
-        self.variable_library = [
-            self.local_dict[key] 
-            for key in self.local_dict 
-            if isinstance(self.local_dict[key], sp.Symbol)
-        ]
+        # 树编辑距离的节点数上限，None 表示不限制
+        self.edit_distance_node_cap = None
+        self._trick_catalogue = None
+        # 所有实例共享同一份只读符号表，不再在每个实例中重建
+        self.local_dict = BASE_NAMESPACE
+        self.variable_library = list(BASE_NAMESPACE.symbols)
 
 
 
     def parse_user_formula(self, formula_str):
-        print(f"\n=== 开始解析公式 ===")
-        print(f"输入公式: '{formula_str}'")
+        logger.debug("开始解析公式: '%s'", formula_str)
         
         # formula_str = str(formula_str).replace('==', '=').replace('α','alpha').replace('β','beta').replace('π','pi')
 
-        if '=' in formula_str:
-            left, right = formula_str.split('=', 1)
-            left_expr = sp.sympify(left, locals=self.local_dict, evaluate=False)
-            right_expr = sp.sympify(right, locals=self.local_dict, evaluate=False)
-            expr = sp.Eq(left_expr, right_expr, evaluate=False)  # 禁止自动化简为布尔值
-        else:
-            expr = sp.sympify(formula_str, locals=self.local_dict, evaluate=False)
-        variables = list(expr.free_symbols)
+        # 含等号时缓存中已是 sp.Eq(..., evaluate=False)，不会被化简为布尔值
+        expr, _, _ = self.parse_cached(formula_str, evaluate=False)
+        variables = ordered_symbols(expr.free_symbols)
         return expr,variables
 
 
 
+    def parse_cached(self, formula_str, evaluate=True):
+        """通过共享解析缓存解析公式，返回 (expr, lhs, rhs)"""
+        return formula_cache.parse(formula_str, self.local_dict, evaluate=evaluate,
+                                   namespace=namespace_of(self.local_dict))
+
+
+
+    def extend_symbol_table(self):
+        """切换到补充了拉丁字母与希腊字母（英文名及 Unicode）的扩展符号表，重复调用结果不变"""
+        self.local_dict = EXTENDED_NAMESPACE
+
+
+
     def separate_left(self, formula):
-        formula = str(formula)
-        formula = formula.replace('==', '=')
-        sides = re.split(r'=(?!=)', formula)
-        
-        for c in 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz':
-            if c not in self.local_dict:
-                self.local_dict[c] = sp.Symbol(c)
-        lower_greek = [
-    'alpha', 'beta', 'gamma', 'delta', 'epsilon', 'zeta', 'eta', 'theta',
-    'iota', 'kappa', 'lambda', 'mu', 'nu', 'xi', 'omicron', 'pi', 'rho',
-    'sigma', 'tau', 'upsilon', 'phi', 'chi', 'psi', 'omega'
-]
-        upper_greek = [name.capitalize() for name in lower_greek]
-        greek_letters = lower_greek+upper_greek
-        for letter in greek_letters:
-            self.local_dict[letter] = sp.Symbol(letter)
-        
-        if len(sides) == 2:
-            return sp.sympify(sides[0].strip(), locals=self.local_dict)
-        return sp.sympify(formula, locals=self.local_dict)
+        """等式左侧（不含等号时为整个表达式），总是按扩展符号表解析并缓存，不修改实例状态"""
+        return self._separate(formula)[0]
 
 
 
     def separate_right(self, formula):
-        formula = str(formula)
-        formula = formula.replace('==', '=')
-        sides = re.split(r'=(?!=)', formula)
-        
-        for c in 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz':
-            if c not in self.local_dict:
-                self.local_dict[c] = sp.Symbol(c)
-        
-        lower_greek = [
-    'α', 'β', 'γ', 'δ', 'ε', 'ζ', 'η', 'θ',
-    'ι', 'κ', 'λ', 'μ', 'ν', 'ξ', 'ο', 'π', 'ρ',
-    'σ', 'τ', 'υ', 'φ', 'χ', 'ψ', 'ω'
-]
-        upper_greek = [
-    'Α', 'Β', 'Γ', 'Δ', 'Ε', 'Ζ', 'Η', 'Θ',
-    'Ι', 'Κ', 'Λ', 'Μ', 'Ν', 'Ξ', 'Ο', 'Π', 'Ρ',
-    'Σ', 'Τ', 'Υ', 'Φ', 'Χ', 'Ψ', 'Ω'
-]
-        greek_letters = lower_greek+upper_greek
-        for letter in greek_letters:
-            self.local_dict[letter] = sp.Symbol(letter)
-        
-        if len(sides) == 2:
-            return sp.sympify(sides[1].strip(), locals=self.local_dict)
-        return sp.sympify(formula, locals=self.local_dict)
+        """等式右侧（不含等号时为整个表达式）"""
+        return self._separate(formula)[1]
+
+
+
+    def _separate(self, formula):
+        expr, lhs, rhs = formula_cache.parse(formula, EXTENDED_NAMESPACE, namespace=EXTENDED_NAMESPACE.name)
+        if lhs is None:
+            return expr, expr
+        return lhs, rhs
       
 
 
     def multiply_with_num(self, formula):
         """对等式两侧乘以同一个随机数/分数，返回字符串形式的等式"""
         if isinstance(formula, sp.Eq):
-            lhs, rhs = formula.lhs, formula.rhs
-        else:  
-            if isinstance(formula, str):
-                if '=' not in formula:
-                    return str(formula)  # 非等式直接返回
-                # 分割并解析左右两侧，禁用求值
-                lhs_str, rhs_str = formula.split('=', 1)
-                lhs = sp.sympify(lhs_str.strip(), locals=self.local_dict, evaluate=False)
-                rhs = sp.sympify(rhs_str.strip(), locals=self.local_dict, evaluate=False)
-                formula = sp.Eq(lhs, rhs, evaluate=False)
-            else:
-                return str(formula)  # 非字符串非等式类型
-            lhs = formula.lhs
-            rhs = formula.rhs
+            pass
+        elif isinstance(formula, str):
+            if '=' not in formula:
+                return str(formula)  # 非等式直接返回
+            # 分割并解析左右两侧，禁用求值
+            formula = self.parse_cached(formula, evaluate=False)[0]
+        else:
+            return str(formula)  # 非字符串非等式类型
         
-        multiplier = random.choice([
-            random.randint(1, 10),
-            sp.Rational(random.randint(1, 5), random.randint(2, 6))
+        return self.eq_to_str(self.multiply_with_num_expr(formula))
+
+
+
+    def multiply_with_num_expr(self, eq):
+        """multiply_with_num 的表达式版本：输入输出均为 sp.Eq"""
+        multiplier = self.rng.choice([
+            self.rng.randint(1, 10),
+            sp.Rational(self.rng.randint(1, 5), self.rng.randint(2, 6))
         ])
         
         # 应用乘数并保持等式结构
-        new_lhs = lhs * multiplier
-        new_rhs = rhs * multiplier
-        new_eq = sp.Eq(new_lhs, new_rhs, evaluate=False)  # 关键修改：禁用求值
-        
-        return f"{sp.sstr(new_eq.lhs)} = {sp.sstr(new_eq.rhs)}"
+        return sp.Eq(eq.lhs * multiplier, eq.rhs * multiplier, evaluate=False)  # 关键修改：禁用求值
         
 
 
@@ -227,9 +111,6 @@ class FormulaManipulator:
             expr_str = f"{expr.lhs} = {expr.rhs}"
         else:
             expr_str = str(expr)  
-        constant = random.randint(-5, 5)
-        if constant == 0:
-            constant = 1 
         if '=' in expr_str:
             left, right = expr_str.split('=', 1)
             left = left.strip()
@@ -243,21 +124,10 @@ class FormulaManipulator:
                     return False
                 
             if not is_numeric(left) and not is_numeric(right):
-                left_expr = sp.sympify(left, locals=self.local_dict)
-                right_expr = sp.sympify(right, locals=self.local_dict)
-                if random.choice([True, False]):
-                    left = left_expr + constant
-                    right = right_expr + constant
-                else:
-                    left = left_expr - constant
-                    right = right_expr - constant
-                left_con = sum(term for term in left.as_ordered_terms() if term.is_number)
-                left_var = sum(term for term in left.as_ordered_terms() if not term.is_number)
-                combined_left = left_con + left_var
-                right_con = sum(term for term in right.as_ordered_terms() if term.is_number)
-                right_var = sum(term for term in right.as_ordered_terms() if not term.is_number)
-                combined_right = right_con + right_var
-                return f"{combined_left} = {combined_right}"           
+                eq = sp.Eq(sp.sympify(left, locals=self.local_dict),
+                           sp.sympify(right, locals=self.local_dict), evaluate=False)
+                new_eq = self.add_elements_expr(eq)
+                return f"{new_eq.lhs} = {new_eq.rhs}"           
             return expr_str
         else:
             if not any(c.isalpha() for c in expr_str):
@@ -266,6 +136,29 @@ class FormulaManipulator:
 
 
 
+    def add_elements_expr(self, eq):
+        """add_elements 的表达式版本：两侧同时加减同一个常数，并把常数项移到前面"""
+        constant = self.rng.randint(-5, 5)
+        if constant == 0:
+            constant = 1 
+        if eq.lhs.is_Number or eq.rhs.is_Number:
+            return eq
+        if self.rng.choice([True, False]):
+            left = eq.lhs + constant
+            right = eq.rhs + constant
+        else:
+            left = eq.lhs - constant
+            right = eq.rhs - constant
+        left_con = sum(term for term in left.as_ordered_terms() if term.is_number)
+        left_var = sum(term for term in left.as_ordered_terms() if not term.is_number)
+        combined_left = left_con + left_var
+        right_con = sum(term for term in right.as_ordered_terms() if term.is_number)
+        right_var = sum(term for term in right.as_ordered_terms() if not term.is_number)
+        combined_right = right_con + right_var
+        return sp.Eq(combined_left, combined_right, evaluate=False)
+
+
+
     def num_replace_with_num(self, formula):
         if isinstance(formula, sp.Eq):
             eq = f"{formula.lhs} = {formula.rhs}"
@@ -285,12 +178,12 @@ class FormulaManipulator:
             return formula
         
         number_pool = list(range(1, 101))
-        replacement_count = random.randint(1, len(numbers))
-        numbers_to_replace = random.sample(numbers, replacement_count)
+        replacement_count = self.rng.randint(1, len(numbers))
+        numbers_to_replace = self.rng.sample(numbers, replacement_count)
         
         for old_num in numbers_to_replace:
             if number_pool:
-                new_num = str(random.choice(number_pool))
+                new_num = str(self.rng.choice(number_pool))
                 number_pool.remove(int(new_num))
                 # 替换左右两边的数字
                 left = left.replace(old_num, new_num, 1)
@@ -302,36 +195,37 @@ class FormulaManipulator:
 
     def generate_unified_substitution(self, expr):
         """生成统一的变量替换规则（优先替换为符号库中的其他变量，否则替换为数字）"""
-        variables = list(expr.free_symbols)
+        variables = ordered_symbols(expr.free_symbols)
         if not variables:
             return {} 
         
-        old_var = random.choice(variables)
+        old_var = self.rng.choice(variables)
         possible_vars = [var for var in self.variable_library if var != old_var]
         
         if possible_vars:
-            new_var = random.choice(possible_vars)
+            new_var = self.rng.choice(possible_vars)
             return {old_var: new_var}
         else:
-            return {old_var: random.randint(1, 10)}
+            return {old_var: self.rng.randint(1, 10)}
 
 
 
     def replace_with_number(self, formula):
         if isinstance(formula, sp.Eq):
-            lhs, rhs = formula.lhs, formula.rhs
+            pass
         elif isinstance(formula, str) and '=' in formula:
-            lhs_str, rhs_str = formula.split('=', 1)
-            lhs = sp.sympify(lhs_str, locals=self.local_dict, evaluate=False) 
-            rhs = sp.sympify(rhs_str, locals=self.local_dict, evaluate=False) 
+            formula = self.parse_cached(formula, evaluate=False)[0]
         else:
             return str(formula)
         
-        substitution = self.generate_unified_substitution(lhs)
-        new_lhs = lhs.subs(substitution)
-        new_rhs = rhs.subs(substitution)
-        
-        return f"{sp.sstr(new_lhs)} = {sp.sstr(new_rhs)}"
+        return self.eq_to_str(self.replace_with_number_expr(formula))
+
+
+
+    def replace_with_number_expr(self, eq):
+        """replace_with_number 的表达式版本"""
+        substitution = self.generate_unified_substitution(eq.lhs)
+        return sp.Eq(eq.lhs.subs(substitution), eq.rhs.subs(substitution), evaluate=False)
 
 
 
@@ -341,72 +235,75 @@ class FormulaManipulator:
         if isinstance(formula, sp.Eq):
             lhs, rhs = formula.lhs, formula.rhs
         elif isinstance(formula, str) and '=' in formula:
-            lhs_str, rhs_str = formula.split('=', 1)
-            lhs = sp.sympify(lhs_str, locals=self.local_dict, evaluate=False)
-            rhs = sp.sympify(rhs_str, locals=self.local_dict, evaluate=False)
+            _, lhs, rhs = self.parse_cached(formula, evaluate=False)
         else:
             expr = sp.sympify(formula, locals=self.local_dict, evaluate=False) if isinstance(formula, str) else formula
             symbols = expr.free_symbols
             if not symbols:
                 return str(expr)
-            symbol_to_replace = random.choice(list(symbols))
+            symbol_to_replace = self.rng.choice(ordered_symbols(symbols))
             # 从变量库中选择新变量并转换为符号
-            new_var = random.choice(self.variable_library)
+            new_var = self.rng.choice(self.variable_library)
             new_var_sym = sp.sympify(new_var, locals=self.local_dict)
             new_expr = expr.subs(symbol_to_replace, new_var_sym)
             return sp.sstr(new_expr)
         
-        symbols = lhs.free_symbols
+        return self.eq_to_str(self.replace_with_variable_expr(sp.Eq(lhs, rhs, evaluate=False)))
+
+
+
+    def replace_with_variable_expr(self, eq):
+        """replace_with_variable 的表达式版本"""
+        symbols = eq.lhs.free_symbols
         if not symbols:
-            return f"{sp.sstr(lhs)} = {sp.sstr(rhs)}"
+            return eq
         
-        symbol_to_replace = random.choice(list(symbols))
+        symbol_to_replace = self.rng.choice(ordered_symbols(symbols))
         # 从变量库中选择新变量并转换为符号
-        new_var = random.choice(self.variable_library)
+        new_var = self.rng.choice(self.variable_library)
         new_var_sym = sp.sympify(new_var, locals=self.local_dict)
         
-        new_lhs = lhs.subs(symbol_to_replace, new_var_sym)
-        new_rhs = rhs.subs(symbol_to_replace, new_var_sym)
+        new_lhs = eq.lhs.subs(symbol_to_replace, new_var_sym)
+        new_rhs = eq.rhs.subs(symbol_to_replace, new_var_sym)
         
-        return f"{sp.sstr(new_lhs)} = {sp.sstr(new_rhs)}"
+        return sp.Eq(new_lhs, new_rhs, evaluate=False)
 
 
 
-    def replace_with_formula(self, formula, all_tricks):
-        # 解析原始公式
+    def replace_with_formula(self, formula, tricks=None):
+        """
+        随机选择右侧的一个变量和一个技巧，左侧中的该变量替换为技巧左侧、右侧中的替换为技巧右侧
+        技巧两侧在目录中预先解析，每次调用只构造被选中的一个替换
+        """
         formula_str = str(formula) if not isinstance(formula, str) else formula
-        print(formula_str)
-        if '=' in formula_str:
-            orig_left, orig_right = formula_str.split('=', 1)
-            orig_left_expr = sp.sympify(orig_left.strip(), locals=self.local_dict)
-            orig_right_expr = sp.sympify(orig_right.strip(), locals=self.local_dict)
-        else:
-            orig_expr = sp.sympify(formula_str, locals=self.local_dict)
-            orig_left_expr = orig_expr
-            orig_right_expr = sp.Integer(0)
-        
-        valid_replacements = []
-        orig_right_vars = orig_right_expr.free_symbols
-        
-        # 遍历所有技巧公式的右侧
-        for trick_formula in all_tricks:
-            if '=' in trick_formula:
-                _, trick_right = trick_formula.split('=', 1)
-                trick_right_expr = sp.sympify(trick_right.strip(), locals=self.local_dict)
-                trick_left, _ = trick_formula.split('=', 0)
-                trick_left_expr = sp.sympify(trick_left.strip(), locals=self.local_dict)
-            
-                for var in orig_right_vars:
-                    # 在替换的式子外添加括号
-                    new_right = orig_right_expr.subs(var, f"({trick_right_expr})")
-                    new_left = orig_left_expr.subs(var, f"({trick_left_expr})")
-                    new_formula = f"{sp.sstr(new_left)} = {sp.sstr(new_right)}"
-                    valid_replacements.append(new_formula)
-        
-        if valid_replacements:
-            return random.choice(valid_replacements)
+        logger.debug("replace_with_formula 输入: %s", formula_str)
+        if isinstance(formula, sp.Eq):
+            orig_left_expr, orig_right_expr = formula.lhs, formula.rhs
+        elif '=' in formula_str:
+            _, orig_left_expr, orig_right_expr = self.parse_cached(formula_str)
         else:
+            # 不是等式时右侧视为 0，没有可替换的变量
             return formula_str
+        
+        # 任一可解析的技巧都可以替换任一变量，分别均匀抽取即等价于在 技巧 × 变量 上均匀抽取
+        substitutions = self._catalogue_for(tricks).substitutions()
+        variables = ordered_symbols(orig_right_expr.free_symbols)
+        if not substitutions or not variables:
+            return formula_str
+        
+        var = self.rng.choice(variables)
+        trick_left_expr, trick_right_expr = self.rng.choice(substitutions)
+        new_left = orig_left_expr.xreplace({var: trick_left_expr})
+        new_right = orig_right_expr.xreplace({var: trick_right_expr})
+        return f"{sp.sstr(new_left)} = {sp.sstr(new_right)}"
+
+
+
+    def _catalogue_for(self, tricks):
+        """config.all_tricks（或省略）使用实例缓存的目录，其他技巧集合的目录按对象身份缓存，只构建一次"""
+        if tricks is None or tricks is all_tricks:
+            return self.trick_catalogue
+        return TrickCatalogue.cached(tricks, self.local_dict)
 
 
 
@@ -433,10 +330,10 @@ class FormulaManipulator:
        
         modified_structure = {}
 
-        swap_times = random.randint(1, min(5, len(terms)))
+        swap_times = self.rng.randint(1, min(5, len(terms)))
         
         for i in range(swap_times):
-            idx1, idx2 = random.sample(range(len(terms)), 2)
+            idx1, idx2 = self.rng.sample(range(len(terms)), 2)
             
             terms[idx1], terms[idx2] = terms[idx2], terms[idx1]
             
@@ -482,12 +379,12 @@ class FormulaManipulator:
             if isinstance(lhs, sp.Mul):
                 factors = list(lhs.args)
                 if len(factors) >= 2:
-                    idx1, idx2 = random.sample(range(len(factors)), 2)
+                    idx1, idx2 = self.rng.sample(range(len(factors)), 2)
                     factors[idx1], factors[idx2] = factors[idx2], factors[idx1]
                     new_lhs = factors[0]
                     for factor in factors[1:]:
                         new_lhs *= factor
-                    return sp.Eq(new_lhs, rhs)  # 返回新的等式对象
+                    return sp.Eq(new_lhs, rhs, evaluate=False)  # 返回新的等式对象，禁止化简为布尔值
             
             # 左边不是乘法表达式，返回原表达式
             return expr
@@ -496,7 +393,7 @@ class FormulaManipulator:
         if isinstance(expr, sp.Mul):
             factors = list(expr.args)
             if len(factors) >= 2:
-                idx1, idx2 = random.sample(range(len(factors)), 2)
+                idx1, idx2 = self.rng.sample(range(len(factors)), 2)
                 factors[idx1], factors[idx2] = factors[idx2], factors[idx1]
                 new_expr = factors[0]
                 for factor in factors[1:]:
@@ -512,6 +409,15 @@ class FormulaManipulator:
 
 
 
+    def parse_formula(self, formula_str):
+        """解析公式字符串，失败时返回 None"""
+        try:
+            return self.parse_cached(formula_str, evaluate=False)[0]
+        except Exception:
+            return None
+
+
+
     def process_and_compare_formula(self, original_formula_str, modified_formula_str=None):
         result = {
             "original_structure": None,
@@ -519,65 +425,54 @@ class FormulaManipulator:
             "changes": []
         }
         
-        def compare_structures(orig_struct, mod_struct, path=[]):
+        def compare_structures(orig_struct, mod_struct):
             changes = []
             
-            # 获取所有节点的标签
-            def get_labels(struct, curr_path=[]):
-                labels = []
-                for key, value in struct.items():
-                    new_path = curr_path + [key]
-                    if isinstance(value, dict):
-                        if 'label' in value:
-                            labels.append((value['label'], value.get('content', ''), new_path))
-                        if 'terms' in value:
-                            labels.extend(get_labels(value['terms'], new_path))
-                return labels
-            
-            # 获取两个结构的所有标签
-            orig_labels = get_labels(orig_struct)
-            mod_labels = get_labels(mod_struct)
-            
             # 按层级排序（叶到根）
-            orig_labels.sort(key=lambda x: (-int(x[0].split('_')[0][1:]), x[2]))
-            mod_labels.sort(key=lambda x: (-int(x[0].split('_')[0][1:]), x[2]))
+            def sorted_nodes(struct):
+                return sorted(range(len(struct)), key=lambda node: (-struct.levels[node], struct.path(node)))
+            
+            # 按内容分组，避免两两比较所有节点；内容字符串只在这里才生成
+            mod_by_content = {}
+            for node in sorted_nodes(mod_struct):
+                mod_by_content.setdefault(mod_struct.content(node), []).append(node)
             
             # 比较标签变化
-            for orig_label, orig_content, orig_path in orig_labels:
-                for mod_label, mod_content, mod_path in mod_labels:
-                    if orig_content == mod_content and orig_label != mod_label:
+            for orig_node in sorted_nodes(orig_struct):
+                orig_label = orig_struct.label(orig_node)
+                orig_content = orig_struct.content(orig_node)
+                for mod_node in mod_by_content.get(orig_content, []):
+                    mod_label = mod_struct.label(mod_node)
+                    if orig_label != mod_label:
                         changes.append({
                             'content': orig_content,
                             'original_label': orig_label,
                             'modified_label': mod_label,
-                            'path': orig_path
+                            'path': orig_struct.path(orig_node)
                         })
             
             return changes
             
-        # 解析原始公式结构
+        # 解析原始公式结构；比较使用 CompactStructure，返回结果中存放可写入 JSON 的 to_dict()
+        original_structure = modified_structure = None
         original_expr = self.parse_formula(original_formula_str)
         if original_expr is not None:
-            result["original_structure"] = self.record_structure(original_expr)
+            original_structure = self.record_structure(original_expr)
+            result["original_structure"] = original_structure.to_dict()
         
         # 解析修改后公式结构
         if modified_formula_str:
             modified_expr = self.parse_formula(modified_formula_str)
             if modified_expr is not None:
-                result["modified_structure"] = self.record_structure(modified_expr)
+                modified_structure = self.record_structure(modified_expr)
+                result["modified_structure"] = modified_structure.to_dict()
         
         # 计算结构差异
-        if result["original_structure"] and result["modified_structure"]:
-            result["changes"] = compare_structures(
-                result["original_structure"],
-                result["modified_structure"]
-            )
+        if original_structure and modified_structure:
+            result["changes"] = compare_structures(original_structure, modified_structure)
             
             # 计算编辑距离
-            edit_distance = self.compute_edit_distance(
-                result["original_structure"],
-                result["modified_structure"]
-            )
+            edit_distance = self.compute_edit_distance(original_structure, modified_structure)
             result["edit_distance"] = edit_distance  # 直接更新复杂度字段
         
         return result
@@ -585,57 +480,30 @@ class FormulaManipulator:
 
 
     def record_structure(self, expr):
-        #结构记录函数
-        structure = {}
-        
-        def process_term(term, current_dict, index, level=0):
-            if isinstance(term, (sp.Add, sp.Mul, sp.sin, sp.cos, sp.tan, sp.cot)):
-                current_dict[str(index)] = {
-                    'type': term.__class__.__name__,
-                    'content': str(term),
-                    'label': f"L{level}_{index}",
-                    'terms': {}
-                }
-                if hasattr(term, 'args'):
-                    for i, subterm in enumerate(term.args):
-                        process_term(subterm, current_dict[str(index)]['terms'], i, level + 1)
-            else:
-                current_dict[str(index)] = {
-                    'type': 'Basic',
-                    'content': str(term),
-                    'label': f"L{level}_{index}"
-                }
-            
-        if isinstance(expr, (sp.Add, sp.Mul, sp.sin, sp.cos, sp.tan, sp.cot)):
-            for i, term in enumerate(expr.args):
-                process_term(term, structure, i)
-        else:
-            process_term(expr, structure, 0)
-            
-        return structure
+        """结构记录函数，返回按数组存储的 CompactStructure，可用 to_dict() 得到原嵌套格式"""
+        return CompactStructure.from_expr(expr)
     
 
 
-    def compute_edit_distance(self, struct1, struct2):
-        """计算两个结构之间的编辑距离"""
-        def get_structure_sequence(struct):
-            sequence = []
-            def traverse(d):
-                if isinstance(d, dict):
-                    for key in sorted(d.keys()):  # 确保顺序一致
-                        if isinstance(d[key], dict) and 'type' in d[key]:
-                            sequence.append(f"{d[key]['type']}_{d[key]['content']}")
-                            if 'terms' in d[key]:
-                                traverse(d[key]['terms'])
-            
-            traverse(struct)
-            return sequence
-        
-        # 获取两个结构的序列表示
-        seq1 = get_structure_sequence(struct1)
-        seq2 = get_structure_sequence(struct2)
-        
-        return fuzz.ratio(''.join(seq1), ''.join(seq2))
+    def compute_edit_distance(self, struct1, struct2, node_cap=None):
+        """
+        计算两棵表达式树之间的树编辑距离（Zhang–Shasha），换算为 0–100 的相似度
+        参数可以是 SymPy 表达式、公式字符串或 record_structure 的结果
+        """
+        if node_cap is None:
+            node_cap = self.edit_distance_node_cap
+        return tree_similarity(self._edit_tree(struct1, node_cap), self._edit_tree(struct2, node_cap))
+
+
+
+    def _edit_tree(self, obj, node_cap):
+        if isinstance(obj, str):
+            try:
+                obj = self.parse_cached(obj, evaluate=False)[0]
+            except Exception:
+                # 无法解析的字符串视为单个节点
+                return LabeledTree([obj], [[]])
+        return as_tree(obj, node_cap)
 
 
 
@@ -659,21 +527,16 @@ class FormulaManipulator:
                 return formula_str
 
         # 随机选择转换方式
-        transform_type = random.choice(['number', 'trick'])
+        transform_type = self.rng.choice(['number', 'trick'])
         
         if transform_type == 'number':
             # 随机选择一个2到10之间的数字作为底数
-            base = random.randint(2, 10)
+            base = self.rng.randint(2, 10)
             # 构造新的等式，左右两侧分别进行幂次处理
             new_formula = f"{base}**({lhs_str}) = {base}**({rhs_str})"
         else:
-            # 从all_tricks中随机选择一个等式作为底数
-            trick = random.choice(list(all_tricks.keys()))
-            if '=' in trick:
-                # 如果trick是等式，取等号左边作为底数
-                base = trick.split('=')[0].strip()
-            else:
-                base = trick.strip()
+            # 从all_tricks中随机选择一个等式，取等号左边作为底数
+            base = self.rng.choice(self.trick_catalogue.entries).left
             # 构造新的等式，左右两侧分别作为底数
             new_formula = f"({lhs_str})**({base}) = ({rhs_str})**({base})"
         
@@ -681,18 +544,96 @@ class FormulaManipulator:
 
 
 
-    def execute_functions(self, user_formula, times=None):
-        print(f"\n=== 开始执行变换 ===")
-        print(f"输入公式: {user_formula}")
+    def power_transform_expr(self, eq):
+        """power_transform 的表达式版本：直接构造未求值的 Pow，不经过字符串拼接"""
+        transform_type = self.rng.choice(['number', 'trick'])
         
-        results = []
-        score = 0
+        if transform_type == 'number':
+            base = sp.Integer(self.rng.randint(2, 10))
+            return sp.Eq(sp.Pow(base, eq.lhs, evaluate=False),
+                         sp.Pow(base, eq.rhs, evaluate=False), evaluate=False)
+        
+        base = self.rng.choice(self.trick_catalogue.entries).lhs_expr
+        if base is None:
+            return eq
+        return sp.Eq(sp.Pow(eq.lhs, base, evaluate=False),
+                     sp.Pow(eq.rhs, base, evaluate=False), evaluate=False)
+
+
+
+    @property
+    def trick_catalogue(self):
+        """config.all_tricks 的技巧目录，首次使用时构建"""
+        if self._trick_catalogue is None:
+            self._trick_catalogue = TrickCatalogue(all_tricks, self.local_dict)
+        return self._trick_catalogue
 
+
+
+    def eq_to_str(self, eq, printer=None):
+        """printer 为 MemoStrPrinter 时共享已打印的子树，输出与 sp.sstr 相同"""
+        doprint = printer.doprint if printer is not None else sp.sstr
+        if isinstance(eq, sp.Eq):
+            return f"{doprint(eq.lhs)} = {doprint(eq.rhs)}"
+        return eq if isinstance(eq, str) else doprint(eq)
+
+
+
+    def _transform(self, name, eq):
+        """
+        在 sp.Eq 上执行名为 name 的变换，不经过字符串往返
+        子类用字符串接口覆盖了该变换时（如 indu_form.replace_with_number），退回字符串接口并重新解析
+        """
+        if isinstance(eq, sp.Eq) and getattr(type(self), name) is getattr(FormulaManipulator, name):
+            return getattr(self, name + '_expr')(eq)
+        result = getattr(self, name)(self.eq_to_str(eq))
+        try:
+            return self.parse_cached(result, evaluate=False)[0]
+        except Exception:
+            return result
+
+
+
+    def execute_functions(self, user_formula, times=None):
+        logger.debug("开始执行变换: %s", user_formula)
+
+        prepared = self.prepare_formula(user_formula)
+        if prepared is None:
+            logger.warning("无法解析公式: %s", user_formula)
+            return []
+        return self.run_transform_round(prepared)
+
+    def prepare_formula(self, user_formula):
+        """
+        解析公式并记录原始结构，返回 (expr, variables, original_tree)，无法解析时返回 None
+        同一公式的多轮变换共享这份结果，不必每轮重新解析和重建原始树
+        """
         expr, variables = self.parse_user_formula(user_formula)
         if expr is None:
-            print(f"无法解析公式: {user_formula}")
-            return []
-        
+            return None
+        return expr, variables, as_tree(expr, self.edit_distance_node_cap)
+
+    def execute_functions_batch(self, formulas, rounds=1, before_round=None):
+        """
+        批量执行变换：formulas 中每项为公式字符串或 (公式, 轮数)，未给出轮数时使用 rounds
+        每个公式只解析一次，之后逐轮产出 (序号, 轮次, times, results)
+        before_round(序号, 轮次) 在每轮开始前调用（例如设置随机种子），其返回值作为 times 一并产出
+        """
+        for position, item in enumerate(formulas):
+            user_formula, formula_rounds = item if isinstance(item, tuple) else (item, rounds)
+            prepared = self.prepare_formula(user_formula)
+            for transformation_round in range(formula_rounds):
+                times = before_round(position, transformation_round) if before_round else None
+                results = self.run_transform_round(prepared) if prepared is not None else []
+                yield position, transformation_round, times, results
+
+    def run_transform_round(self, prepared):
+        """对 prepare_formula 的结果执行一轮三阶段变换"""
+        expr, variables, original_tree = prepared
+
+        results = []
+        score = 0
+
         combined_operations = []
         current_expr = expr
         result = {
@@ -705,31 +646,30 @@ class FormulaManipulator:
                 "score": 0
             }
         }
-        original_struct = self.record_structure(expr)
         
-        # 执行变换操作
+        # 执行变换操作，三个阶段全程在内存中保持 sp.Eq，只在最后转换为字符串
         for _ in range(1):
             # 第一阶段 - 操作4、8和9
             pre_transformed = current_expr
             first_phase_ops = [4, 8, 9]  # 添加新的操作类型9
             for _ in range(5):
-                operationa = random.choice(first_phase_ops)
+                operationa = self.rng.choice(first_phase_ops)
               
                 if operationa == 4:
-                    pre_transformed = self.multiply_with_num(pre_transformed)
+                    pre_transformed = self._transform('multiply_with_num', pre_transformed)
                     score += 1
                 elif operationa == 8:
-                    pre_transformed = self.add_elements(pre_transformed) 
+                    pre_transformed = self._transform('add_elements', pre_transformed) 
                     score += 1
                 elif operationa == 9:
-                    pre_transformed = self.power_transform(pre_transformed)
+                    pre_transformed = self._transform('power_transform', pre_transformed)
                     score += 1
                 combined_operations.append((operationa,pre_transformed))
             # 第二阶段 - 执行6 or 7
             post_transformed = pre_transformed
             second_phase_ops = [6, 7]  
             for _ in range(3):
-                operationb = random.choice(second_phase_ops)
+                operationb = self.rng.choice(second_phase_ops)
                 combined_operations.append(operationb)
                 if operationb == 6:
                     new_expr = self.swap_mul_terms(post_transformed)
@@ -742,41 +682,47 @@ class FormulaManipulator:
                         post_transformed = new_expr
                         score += 1
                 combined_operations.append((operationb,post_transformed))
-            # 第三阶段 
+            # 第三阶段：求值化简（相当于原来按 evaluate=True 重新解析）
             final_transformed = post_transformed
-            if '=' in final_transformed:
-                lhs, rhs = final_transformed.split('=')
+            if isinstance(final_transformed, sp.Eq):
+                final_transformed = sp.Eq(final_transformed.lhs.doit(), final_transformed.rhs.doit(), evaluate=False)
+                current_vars = final_transformed.lhs.free_symbols.union(final_transformed.rhs.free_symbols)  # 合并左右变量
+            elif '=' in str(final_transformed):
+                lhs, rhs = str(final_transformed).split('=')
                 lhs_expr = sp.sympify(lhs.strip(), locals=self.local_dict)
                 rhs_expr = sp.sympify(rhs.strip(), locals=self.local_dict)
-                current_vars = lhs_expr.free_symbols.union(rhs_expr.free_symbols)  # 合并左右变量
-                var_count = len(current_vars)
-                final_transformed = f"{sp.sstr(lhs_expr)} = {sp.sstr(rhs_expr)}"
+                final_transformed = sp.Eq(lhs_expr, rhs_expr, evaluate=False)
+                current_vars = lhs_expr.free_symbols.union(rhs_expr.free_symbols)
             else:
-                expr = sp.sympify(final_transformed.strip(), locals=self.local_dict)
-                current_vars = expr.free_symbols
-                var_count = len(current_vars)
-                final_transformed = sp.sstr(expr)
+                final_transformed = sp.sympify(str(final_transformed).strip(), locals=self.local_dict)
+                current_vars = final_transformed.free_symbols
+            var_count = len(current_vars)
 
             third_phase_ops = [1, 2]
             weights = [0.05, 0.95] if var_count > 1 else [0.0, 1.0]  # 简化判断
 
             for _ in range(1):
-                operationc = random.choices(third_phase_ops, weights=weights, k=1)[0]
+                operationc = self.rng.choices(third_phase_ops, weights=weights, k=1)[0]
                 combined_operations.append(operationc)
                 if operationc == 1:
-                    final_transformed = self.replace_with_number(final_transformed)
+                    final_transformed = self._transform('replace_with_number', final_transformed)
                 elif operationc == 2:
-                    final_transformed = self.replace_with_variable(final_transformed)
+                    final_transformed = self._transform('replace_with_variable', final_transformed)
                 combined_operations.append((operationc,final_transformed))
             if final_transformed is not None:
+                # 只在写入记录时把各步结果转换为字符串；各步共用一个打印器，
+                # 后一步包含的前一步子树、未改变的步骤以及 formula_after 都不会重复打印
+                printer = MemoStrPrinter()
                 result['tricks'].append({
-                    "operation": combined_operations,
-                    "formula_after": str(final_transformed)
+                    "operation": [
+                        (step[0], self.eq_to_str(step[1], printer)) if isinstance(step, tuple) else step
+                        for step in combined_operations
+                    ],
+                    "formula_after": self.eq_to_str(final_transformed, printer)
                 })
                 current_expr = final_transformed
         
-        modified_struct = self.record_structure(current_expr)
-        edit_distance = self.compute_edit_distance(original_struct, modified_struct)
+        edit_distance = self.compute_edit_distance(original_tree, current_expr)
         result['complexity'] = edit_distance + score
 
         results.append(result)
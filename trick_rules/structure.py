@@ -0,0 +1,96 @@
+import sympy as sp
+
+from .tree_edit_distance import LabeledTree
+
+
+# record_structure 中会继续向下展开的节点类型，其余节点都记为 'Basic' 叶子
+EXPANDED_TYPES = (sp.Add, sp.Mul, sp.sin, sp.cos, sp.tan, sp.cot)
+
+
+class CompactStructure:
+    """
+    record_structure 的紧凑表示：按先序存放的平行数组
+    types/parents/indices/levels 记录树形，terms 保存对应的 SymPy 子树引用
+    节点内容字符串 str(term) 只在 content() 被调用时才生成并缓存，避免每层重复打印整棵子树
+    """
+
+    __slots__ = ('types', 'parents', 'indices', 'levels', 'terms', '_contents')
+
+    def __init__(self):
+        self.types = []
+        self.parents = []
+        self.indices = []
+        self.levels = []
+        self.terms = []
+        self._contents = {}
+
+    @classmethod
+    def from_expr(cls, expr):
+        structure = cls()
+        if isinstance(expr, EXPANDED_TYPES):
+            top_level = list(enumerate(expr.args))
+        else:
+            top_level = [(0, expr)]
+        stack = [(term, -1, index, 0) for index, term in reversed(top_level)]
+        while stack:
+            term, parent, index, level = stack.pop()
+            node = len(structure.types)
+            expanded = isinstance(term, EXPANDED_TYPES)
+            structure.types.append(term.__class__.__name__ if expanded else 'Basic')
+            structure.parents.append(parent)
+            structure.indices.append(index)
+            structure.levels.append(level)
+            structure.terms.append(term)
+            if expanded:
+                stack.extend((arg, node, i, level + 1) for i, arg in reversed(list(enumerate(term.args))))
+        return structure
+
+    def __len__(self):
+        return len(self.types)
+
+    def content(self, node):
+        content = self._contents.get(node)
+        if content is None:
+            content = str(self.terms[node])
+            self._contents[node] = content
+        return content
+
+    def label(self, node):
+        return f"L{self.levels[node]}_{self.indices[node]}"
+
+    def path(self, node):
+        path = []
+        while node != -1:
+            path.append(str(self.indices[node]))
+            node = self.parents[node]
+        return path[::-1]
+
+    def is_leaf(self, node):
+        return self.types[node] == 'Basic'
+
+    def to_dict(self):
+        """转换为原来的嵌套 dict 格式（会生成全部内容字符串，仅用于序列化）"""
+        structure = {}
+        containers = {-1: structure}
+        for node in range(len(self)):
+            entry = {
+                'type': self.types[node],
+                'content': self.content(node),
+                'label': self.label(node)
+            }
+            if not self.is_leaf(node):
+                entry['terms'] = {}
+                containers[node] = entry['terms']
+            containers[self.parents[node]][str(self.indices[node])] = entry
+        return structure
+
+    def to_labeled_tree(self, node_cap=None):
+        """转换为树编辑距离使用的 LabeledTree，顶层各项挂在一个虚拟根节点下"""
+        count = len(self) if node_cap is None else min(len(self), max(node_cap - 1, 0))
+        labels = ['Root']
+        children = [[]]
+        for node in range(count):
+            labels.append(self.content(node) if self.is_leaf(node) else self.types[node])
+            children.append([])
+            children[self.parents[node] + 1].append(node + 1)
+        return LabeledTree(labels, children)
@@ -1,10 +1,12 @@
-import random
 import re
 from .rule_module import FormulaManipulator
+import logging
+
+logger = logging.getLogger(__name__)
 
 class sum_n_diff_prod(FormulaManipulator):
-    def __init__(self):
-        super().__init__()
+    def __init__(self, rng=None):
+        super().__init__(rng=rng)
         self.set_allowed_operations([1, 2, 3, 4, 5, 6])
 
     def swap_factors(expr_str):
@@ -23,7 +25,7 @@ class sum_n_diff_prod(FormulaManipulator):
     def replace_with_number(self, formula):
         if isinstance(formula, str):
             min_val, max_val = 1, 100
-            random_number = random.randint(min_val, max_val)
+            random_number = self.rng.randint(min_val, max_val)
             return formula.replace('k', str(random_number))
         return str(formula)
        
@@ -36,8 +38,8 @@ class sum_n_diff_prod(FormulaManipulator):
         if expr is None:
             return {}
         
-        print(f"处理公式: {data}")
-        print(f"变量列表: {[str(v) for v in variables]}")
+        logger.debug("处理公式: %s", data)
+        logger.debug("变量列表: %s", variables)
         
         # 执行变换操作
         results = self.execute_functions(data)
@@ -1,10 +1,12 @@
 from .rule_module import FormulaManipulator
-import random
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 class sum_of_perf_squa_n_diff(FormulaManipulator):
-    def __init__(self):
-        super().__init__()
+    def __init__(self, rng=None):
+        super().__init__(rng=rng)
         self.set_allowed_operations([1, 2, 3, 4, 5, 6])
 
     def execute_functions(self, user_formula):
@@ -15,8 +17,8 @@ class sum_of_perf_squa_n_diff(FormulaManipulator):
         
         # 解析输入的公式
         expr, variables = self.parse_user_formula(data)
-        print(f"处理公式: {data}")
-        print(f"变量列表: {[str(v) for v in variables]}")
+        logger.debug("处理公式: %s", data)
+        logger.debug("变量列表: %s", variables)
         
         # 执行变换操作
         results = self.execute_functions(data)
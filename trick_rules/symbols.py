@@ -0,0 +1,182 @@
+import sympy as sp
+
+
+class SymbolNamespace(dict):
+    """
+    只读符号表：sympify 要求 locals 为 dict，因此继承 dict 并禁止一切修改
+    每个进程在导入时构建一次，所有 FormulaManipulator/Operations 实例共享；
+    pickle 时只传递名称，工作进程中还原为该进程自己的同一份实例
+    """
+
+    __slots__ = ('name', 'symbols')
+
+    def __init__(self, name, entries):
+        dict.__init__(self, entries)
+        self.name = name
+        # 变量库：符号表中所有 Symbol，按插入顺序
+        self.symbols = tuple(value for value in self.values() if isinstance(value, sp.Symbol))
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError(f"符号表 '{self.name}' 是只读的")
+
+    __setitem__ = __delitem__ = __ior__ = _readonly
+    setdefault = popitem = clear = update = _readonly
+
+    def pop(self, key, *default):
+        # parse_expr 结束时总会调用 local_dict.pop('', ())，键不存在时按只读语义返回默认值
+        if default and key not in self:
+            return default[0]
+        self._readonly()
+
+    def copy(self):
+        """返回可修改的普通 dict 副本"""
+        return dict(self)
+
+    def __reduce__(self):
+        return (get_namespace, (self.name,))
+
+
+def _base_entries():
+    return {
+    # 三角函数
+    'sin': sp.Function('sin'),
+    'cos': sp.Function('cos'),
+    'tan': sp.Function('tan'),
+    'cot': sp.Function('cot'),
+
+    # 小写希腊字母
+    'π': sp.Symbol('π'),          # \u03C0
+    'α': sp.Symbol('α'),          # \u03B1
+    'β': sp.Symbol('β'),          # \u03B2
+    'γ': sp.Symbol('γ'),          # \u03B3
+    'δ': sp.Symbol('δ'),          # \u03B4
+    'ε': sp.Symbol('ε'),          # \u03B5
+    'ζ': sp.Symbol('ζ'),          # \u03B6
+    'η': sp.Symbol('η'),          # \u03B7
+    'θ': sp.Symbol('θ'),          # \u03B8
+    'ι': sp.Symbol('ι'),          # \u03B9
+    'κ': sp.Symbol('κ'),          # \u03BA
+    'λ': sp.Symbol('λ'),          # \u03BB
+    'μ': sp.Symbol('μ'),          # \u03BC
+    'ν': sp.Symbol('ν'),          # \u03BD
+    'ξ': sp.Symbol('ξ'),          # \u03BE
+    'ο': sp.Symbol('ο'),          # \u03BF
+    'ρ': sp.Symbol('ρ'),          # \u03C1
+    'σ': sp.Symbol('σ'),          # \u03C3
+    'τ': sp.Symbol('τ'),          # \u03C4
+    'υ': sp.Symbol('υ'),          # \u03C5
+    'φ': sp.Symbol('φ'),          # \u03C6
+    'χ': sp.Symbol('χ'),          # \u03C7
+    'ψ': sp.Symbol('ψ'),          # \u03C8
+    'ω': sp.Symbol('ω'),          # \u03C9
+
+    # 大写希腊字母
+    'Α': sp.Symbol('Α'),          # \u0391
+    'Β': sp.Symbol('Β'),          # \u0392
+    'Γ': sp.Symbol('Γ'),          # \u0393
+    'Δ': sp.Symbol('Δ'),          # \u0394
+    'Θ': sp.Symbol('Θ'),          # \u0398
+    'Λ': sp.Symbol('Λ'),          # \u039B
+    'Σ': sp.Symbol('Σ'),          # \u03A3
+    'Ω': sp.Symbol('Ω'),          # \u03A9
+    
+    # 基础变量
+    'a': sp.Symbol('a'),
+    'b': sp.Symbol('b'),
+    'c': sp.Symbol('c'),
+    'd': sp.Symbol('d'),
+    'e': sp.Symbol('e'),
+    'f': sp.Symbol('f'),
+    'g': sp.Symbol('g'),
+    'h': sp.Symbol('h'),
+    'i': sp.Symbol('i'),
+    'j': sp.Symbol('j'),
+    'k': sp.Symbol('k'),
+    'l': sp.Symbol('l'),
+    'm': sp.Symbol('m'),
+    'n': sp.Symbol('n'),
+    'o': sp.Symbol('o'),
+    'p': sp.Symbol('p'),
+    'q': sp.Symbol('q'),
+    'r': sp.Symbol('r'),
+    's': sp.Symbol('s'),
+    't': sp.Symbol('t'),
+    'u': sp.Symbol('u'),
+    'v': sp.Symbol('v'),
+    'w': sp.Symbol('w'),
+    'x': sp.Symbol('x'),
+    'y': sp.Symbol('y'),
+    'z': sp.Symbol('z'),
+    'A': sp.Symbol('A'),
+    'B': sp.Symbol('B'),
+    'C': sp.Symbol('C'),
+    'D': sp.Symbol('D'),
+    'E': sp.Symbol('E'),
+    'F': sp.Symbol('F'),
+    'G': sp.Symbol('G'),
+    'H': sp.Symbol('H'),
+    'I': sp.Symbol('I'),
+    'J': sp.Symbol('J'),
+    'K': sp.Symbol('K'),
+    'L': sp.Symbol('L'),
+    'M': sp.Symbol('M'),
+    'N': sp.Symbol('N'),
+    'O': sp.Symbol('O'),
+    'P': sp.Symbol('P'),
+    'Q': sp.Symbol('Q'),
+    'R': sp.Symbol('R'),
+    'S': sp.Symbol('S'),
+    'T': sp.Symbol('T'),
+    'U': sp.Symbol('U'),
+    'V': sp.Symbol('V'),
+    'W': sp.Symbol('W'),
+    'X': sp.Symbol('X'),
+    'Y': sp.Symbol('Y'),
+    'Z': sp.Symbol('Z')
+        }
+
+
+def _extended_entries(base):
+    """在基础符号表上补充拉丁字母与希腊字母（英文名及 Unicode）符号"""
+    entries = dict(base)
+    for c in 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz':
+        entries.setdefault(c, sp.Symbol(c))
+    lower_greek = [
+        'alpha', 'beta', 'gamma', 'delta', 'epsilon', 'zeta', 'eta', 'theta',
+        'iota', 'kappa', 'lambda', 'mu', 'nu', 'xi', 'omicron', 'pi', 'rho',
+        'sigma', 'tau', 'upsilon', 'phi', 'chi', 'psi', 'omega'
+    ]
+    upper_greek = [name.capitalize() for name in lower_greek]
+    for letter in lower_greek + upper_greek:
+        entries[letter] = sp.Symbol(letter)
+
+    lower_greek = [
+        'α', 'β', 'γ', 'δ', 'ε', 'ζ', 'η', 'θ',
+        'ι', 'κ', 'λ', 'μ', 'ν', 'ξ', 'ο', 'π', 'ρ',
+        'σ', 'τ', 'υ', 'φ', 'χ', 'ψ', 'ω'
+    ]
+    upper_greek = [
+        'Α', 'Β', 'Γ', 'Δ', 'Ε', 'Ζ', 'Η', 'Θ',
+        'Ι', 'Κ', 'Λ', 'Μ', 'Ν', 'Ξ', 'Ο', 'Π', 'Ρ',
+        'Σ', 'Τ', 'Υ', 'Φ', 'Χ', 'Ψ', 'Ω'
+    ]
+    for letter in lower_greek + upper_greek:
+        entries[letter] = sp.Symbol(letter)
+    return entries
+
+
+# 基础符号表：构造阶段使用
+BASE_NAMESPACE = SymbolNamespace('base', _base_entries())
+# 扩展符号表：融合阶段与 separate_left/right 使用，希腊字母英文名（alpha、pi 等）解析为普通符号
+EXTENDED_NAMESPACE = SymbolNamespace('extended', _extended_entries(BASE_NAMESPACE))
+
+_NAMESPACES = {namespace.name: namespace for namespace in (BASE_NAMESPACE, EXTENDED_NAMESPACE)}
+
+
+def get_namespace(name):
+    return _NAMESPACES[name]
+
+
+def ordered_symbols(symbols):
+    """按 SymPy 的规范顺序排列符号；free_symbols 是集合，直接 list() 的顺序随 PYTHONHASHSEED 变化"""
+    return sorted(symbols, key=sp.default_sort_key)
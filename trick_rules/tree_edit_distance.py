@@ -0,0 +1,139 @@
+import sympy as sp
+
+
+class LabeledTree:
+    """
+    按后序编号存储的有标签树，供 Zhang–Shasha 算法使用
+    labels[i] 为节点标签，leftmost[i] 为节点 i 最左叶子的后序编号
+    """
+
+    __slots__ = ('labels', 'leftmost', 'keyroots')
+
+    def __init__(self, labels, children, root=0):
+        # children 为按先序编号的子节点列表，这里转换为后序编号
+        post_labels = []
+        leftmost = []
+        first_leaf = {}
+        stack = [(root, False)]
+        while stack:
+            node, visited = stack.pop()
+            if not visited:
+                stack.append((node, True))
+                stack.extend((child, False) for child in reversed(children[node]))
+                continue
+            index = len(post_labels)
+            post_labels.append(labels[node])
+            kids = children[node]
+            first_leaf[node] = first_leaf[kids[0]] if kids else index
+            leftmost.append(first_leaf[node])
+        self.labels = post_labels
+        self.leftmost = leftmost
+        # 每个最左叶子对应的编号最大的节点即为 keyroot
+        keyroots = {}
+        for index, leaf in enumerate(leftmost):
+            keyroots[leaf] = index
+        self.keyroots = sorted(keyroots.values())
+
+    def __len__(self):
+        return len(self.labels)
+
+
+def _node_label(expr):
+    if expr.args:
+        return getattr(expr.func, '__name__', str(expr.func))
+    return str(expr)
+
+
+def tree_from_expr(expr, node_cap=None):
+    """
+    由 SymPy 表达式构建 LabeledTree，内部节点标签为类型名，叶子标签为其字符串
+    超过 node_cap 个节点时按先序截断，超出部分的子树不参与比较
+    """
+    labels = []
+    children = []
+    stack = [(expr, None)]
+    while stack:
+        node, parent = stack.pop()
+        if node_cap is not None and len(labels) >= node_cap:
+            break
+        index = len(labels)
+        labels.append(_node_label(node))
+        children.append([])
+        if parent is not None:
+            children[parent].append(index)
+        stack.extend((arg, index) for arg in reversed(node.args))
+    return LabeledTree(labels, children)
+
+
+def tree_from_structure(structure, node_cap=None):
+    """由 record_structure 的嵌套 dict 构建 LabeledTree，顶层各项挂在一个虚拟根节点下"""
+    labels = ['Root']
+    children = [[]]
+    stack = [(value, 0) for _, value in sorted(structure.items(), reverse=True)]
+    while stack:
+        node, parent = stack.pop()
+        if node_cap is not None and len(labels) >= node_cap:
+            break
+        index = len(labels)
+        terms = node.get('terms')
+        labels.append(node['type'] if terms else node.get('content', ''))
+        children.append([])
+        children[parent].append(index)
+        if terms:
+            stack.extend((value, index) for _, value in sorted(terms.items(), reverse=True))
+    return LabeledTree(labels, children)
+
+
+def tree_distance(tree1, tree2):
+    """Zhang–Shasha 树编辑距离，插入、删除、重标记代价均为 1"""
+    labels1, left1 = tree1.labels, tree1.leftmost
+    labels2, left2 = tree2.labels, tree2.leftmost
+    treedists = [[0] * len(tree2) for _ in range(len(tree1))]
+
+    for i in tree1.keyroots:
+        for j in tree2.keyroots:
+            ioff = left1[i] - 1
+            joff = left2[j] - 1
+            m = i - ioff + 1
+            n = j - joff + 1
+            fd = [[0] * n for _ in range(m)]
+            for x in range(1, m):
+                fd[x][0] = fd[x - 1][0] + 1
+            for y in range(1, n):
+                fd[0][y] = fd[0][y - 1] + 1
+            for x in range(1, m):
+                xi = x + ioff
+                for y in range(1, n):
+                    yj = y + joff
+                    if left1[xi] == left1[i] and left2[yj] == left2[j]:
+                        relabel = 0 if labels1[xi] == labels2[yj] else 1
+                        fd[x][y] = min(fd[x - 1][y] + 1, fd[x][y - 1] + 1, fd[x - 1][y - 1] + relabel)
+                        treedists[xi][yj] = fd[x][y]
+                    else:
+                        p = left1[xi] - 1 - ioff
+                        q = left2[yj] - 1 - joff
+                        fd[x][y] = min(fd[x - 1][y] + 1, fd[x][y - 1] + 1, fd[p][q] + treedists[xi][yj])
+    if not len(tree1) or not len(tree2):
+        return len(tree1) + len(tree2)
+    return treedists[-1][-1]
+
+
+def tree_similarity(tree1, tree2):
+    """把树编辑距离换算为 0–100 的相似度，与 fuzz.ratio 的刻度一致（100 表示完全相同）"""
+    total = len(tree1) + len(tree2)
+    if total == 0:
+        return 100
+    return round(100 * (1 - tree_distance(tree1, tree2) / total))
+
+
+def as_tree(obj, node_cap=None):
+    """接受 LabeledTree、CompactStructure、SymPy 表达式或旧版 record_structure 的嵌套 dict"""
+    if isinstance(obj, LabeledTree):
+        return obj
+    if hasattr(obj, 'to_labeled_tree'):
+        return obj.to_labeled_tree(node_cap)
+    if isinstance(obj, sp.Basic):
+        return tree_from_expr(obj, node_cap)
+    if isinstance(obj, dict):
+        return tree_from_structure(obj, node_cap)
+    raise TypeError(f"不支持的结构类型: {type(obj)}")
@@ -0,0 +1,161 @@
+from collections import OrderedDict
+
+import sympy as sp
+
+from .parse_cache import formula_cache, namespace_of
+from .symbols import EXTENDED_NAMESPACE, ordered_symbols
+
+
+IDENTITY = 'identity'
+NOT_IDENTITY = 'not_identity'
+# 有效采样点不足（极点、溢出、被舍弃的复数值等），无法判断
+UNDETERMINED = 'undetermined'
+ERROR = 'error'
+
+
+class VerificationResult:
+    """单个公式的数值验证结果"""
+
+    __slots__ = ('status', 'max_error', 'valid_points', 'message')
+
+    def __init__(self, status, max_error=None, valid_points=0, message=None):
+        self.status = status
+        self.max_error = max_error
+        self.valid_points = valid_points
+        self.message = message
+
+    def __bool__(self):
+        return self.status == IDENTITY
+
+    def to_dict(self):
+        return {
+            "status": self.status,
+            "max_error": self.max_error,
+            "valid_points": self.valid_points,
+            "message": self.message
+        }
+
+
+def _numpy_functions(np):
+    # local_dict 中的三角函数是未定义的 sp.Function，按名称映射到 NumPy
+    return {
+        'sin': np.sin,
+        'cos': np.cos,
+        'tan': np.tan,
+        'cot': lambda x: 1 / np.tan(x),
+    }
+
+
+class IdentityVerifier:
+    """
+    数值验证生成的公式是否仍为恒等式
+    每个公式只 lambdify 一次（左右两侧一起），在同一批随机点上对所有自由符号向量化求值，
+    |lhs - rhs| <= atol + rtol * max(|lhs|, |rhs|) 在所有有效点上成立即判为恒等式
+    - 默认在实数域求值，sqrt/log/负底数的分数次幂等得到 nan 的点、以及含 I 等得到非实数值的点
+      视为不在定义域内而舍弃；
+      complex_values=True 时改为复数求值并比较主值（负实数附近的分支切割可能带来误报）
+    - 非有限值（极点、溢出）所在的点被舍弃，有效点少于 min_valid 时结果为 undetermined
+    - constants 中的符号（默认 pi/π）代入常数；integer_symbols（默认 k、n）取随机整数，
+      使 sin(2*k*pi + α) = sin(α) 这类依赖整数参数的公式能够通过
+    """
+
+    def __init__(self, local_dict=EXTENDED_NAMESPACE, num_points=32, rtol=1e-6, atol=1e-9,
+                 sample_range=(-3.0, 3.0), integer_range=(-5, 5), min_valid=8,
+                 complex_values=False, constants=None, integer_symbols=('k', 'n'),
+                 seed=0, cache_size=65536):
+        import numpy as np
+        self.np = np
+        self.local_dict = local_dict
+        self.num_points = num_points
+        self.rtol = rtol
+        self.atol = atol
+        self.sample_range = sample_range
+        self.integer_range = integer_range
+        self.min_valid = min_valid
+        self.complex_values = complex_values
+        self.dtype = complex if complex_values else float
+        self.constants = constants if constants is not None else {'pi': np.pi, 'π': np.pi}
+        self.integer_symbols = frozenset(integer_symbols)
+        self.seed = seed
+        self.cache_size = cache_size
+        self._modules = [_numpy_functions(np), 'numpy']
+        self._cache = OrderedDict()
+
+    def verify(self, formula):
+        """验证公式字符串或 sp.Eq，同一公式字符串的结果会被缓存"""
+        key = formula_cache.normalize(formula) if isinstance(formula, str) else None
+        if key is not None and key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+
+        result = self._verify(formula)
+
+        if key is not None:
+            self._cache[key] = result
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return result
+
+    def verify_many(self, formulas):
+        """逐个产出 (formula, VerificationResult)"""
+        for formula in formulas:
+            yield formula, self.verify(formula)
+
+    def _verify(self, formula):
+        np = self.np
+        try:
+            if isinstance(formula, sp.Eq):
+                lhs, rhs = formula.lhs, formula.rhs
+            else:
+                _, lhs, rhs = formula_cache.parse(formula, self.local_dict, evaluate=False,
+                                                  namespace=namespace_of(self.local_dict))
+                if lhs is None:
+                    return VerificationResult(ERROR, message="不是等式")
+            symbols = ordered_symbols(lhs.free_symbols | rhs.free_symbols)
+            func = sp.lambdify(symbols, [lhs, rhs], modules=self._modules)
+            points = self._sample_points(symbols)
+            with np.errstate(all='ignore'):
+                left, right = func(*points)
+                # 先按复数接收结果，实数域求值时不会因转换为 float 而悄悄丢掉虚部
+                left = np.broadcast_to(np.asarray(left, dtype=complex), (self.num_points,))
+                right = np.broadcast_to(np.asarray(right, dtype=complex), (self.num_points,))
+        except Exception as e:
+            return VerificationResult(ERROR, message=f"{type(e).__name__}: {e}")
+
+        with np.errstate(all='ignore'):
+            valid = np.isfinite(left) & np.isfinite(right)
+            if not self.complex_values:
+                valid &= self._is_real(left) & self._is_real(right)
+                left, right = left.real, right.real
+            valid_points = int(valid.sum())
+            if valid_points < self.min_valid:
+                return VerificationResult(UNDETERMINED, valid_points=valid_points)
+            left, right = left[valid], right[valid]
+            error = np.abs(left - right)
+            bound = self.atol + self.rtol * np.maximum(np.abs(left), np.abs(right))
+            max_error = float(error.max())
+            if np.all(error <= bound):
+                return VerificationResult(IDENTITY, max_error, valid_points)
+            return VerificationResult(NOT_IDENTITY, max_error, valid_points)
+
+    def _is_real(self, values):
+        # 虚部相对实部可以忽略（舍入误差）的点视为实数
+        np = self.np
+        return np.abs(values.imag) <= self.atol + self.rtol * np.abs(values.real)
+
+    def _sample_points(self, symbols):
+        """为每个自由符号生成一组采样值；种子固定，同一公式每次验证结果相同"""
+        np = self.np
+        rng = np.random.default_rng(self.seed)
+        low, high = self.sample_range
+        points = []
+        for symbol in symbols:
+            name = str(symbol)
+            if name in self.constants:
+                points.append(np.full(self.num_points, self.constants[name], dtype=self.dtype))
+            elif name in self.integer_symbols:
+                points.append(rng.integers(self.integer_range[0], self.integer_range[1] + 1,
+                                           self.num_points).astype(self.dtype))
+            else:
+                points.append(rng.uniform(low, high, self.num_points).astype(self.dtype))
+        return points